@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+MB/sec and records/sec of fasta parsing, FastaParser.read_fasta (two readline calls and an rstrip per line,
+decoding through a TextIOWrapper) against FastaParser.read_fasta_blocks (large binary blocks split at record starts).
+
+    python benchmarks/bench_fasta_parser.py [--mb 1024] [--length 150] [--width 80] [--fasta some.fa]
+
+the generated file holds records of --length bases in lines of --width (0: a single line);
+use --length 100000000 for chromosome sized records
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from dustdas import fastahelper as fh
+
+
+def write_test_fasta(path, mb, length, width=80):
+    random.seed(0)
+    pool = "".join(random.choice("ACGT") for _ in range(1 << 20))
+    if length > len(pool):
+        pool *= length // len(pool) + 1
+    size = 0
+    i = 0
+    with open(path, "w") as out:
+        while size < mb << 20:
+            start = random.randrange(len(pool) - length + 1)
+            seq = pool[start:start + length]
+            if width > 0:
+                seq = "\n".join(seq[j:j + width] for j in range(0, len(seq), width))
+            record = ">read{} bench\n{}\n".format(i, seq)
+            out.write(record)
+            size += len(record)
+            i += 1
+
+
+def bench(name, path, fun):
+    t = time.time()
+    n = 0
+    for _ in fun(path):
+        n += 1
+    dt = time.time() - t
+    mb = os.path.getsize(path) / float(1 << 20)
+    print("{:<40} {:>10,.1f} MB/sec {:>14,.0f} records/sec".format(name, mb / dt, n / dt))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=1024, help="size of the generated file")
+    parser.add_argument("--length", type=int, default=150, help="length of the generated records")
+    parser.add_argument("--width", type=int, default=80, help="line width of the generated records, 0 for one line")
+    parser.add_argument("--fasta", type=str, help="fasta file to use instead of a generated one")
+    args = parser.parse_args()
+    path = args.fasta
+    if not path:
+        fd, path = tempfile.mkstemp(suffix=".fa")
+        os.close(fd)
+        write_test_fasta(path, args.mb, args.length, args.width)
+    try:
+        bench("before: read_fasta", path, fh.FastaParser.read_fasta)
+        bench("after: read_fasta_blocks", path, fh.FastaParser.read_fasta_blocks)
+        bench("after: read_fasta_blocks(binary=True)", path,
+              lambda p: fh.FastaParser.read_fasta_blocks(p, binary=True))
+    finally:
+        if not args.fasta:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+lines/sec of gff3 line parsing, before (regex per attribute, eager attribute parsing)
+and after dustdas.gfftokenizer (split once, partition, lazy attributes).
+
+    python benchmarks/bench_gff_tokenizer.py [--lines 1000000] [--gff some.gff3]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from dustdas import gffhelper as gh
+from dustdas import gfftokenizer as gt
+
+
+class LegacyGFFObject(object):
+    """GFFObject line parsing as it was before gfftokenizer"""
+    def __init__(self, gffline):
+        gffcols = [g.strip() for g in gffline.split("\t")]
+        d = {"seqid": gffcols[0], "source": gffcols[1], "type": gffcols[2], "start": gffcols[3],
+             "end": gffcols[4], "score": gffcols[5], "strand": gffcols[6], "phase": gffcols[7],
+             "attribute": gffcols[8]}
+        self.seqid = d["seqid"]
+        self.source = d["source"]
+        self.type = d["type"]
+        self.start = d["start"]
+        self.end = d["end"]
+        try:
+            self.score = float(d["score"])
+        except ValueError:
+            self.score = "."
+        self.strand = d["strand"]
+        self.phase = d["phase"]
+        self.attribute = d["attribute"]
+        self.attributes = [LegacyGFFAttribute(x.strip()) for x in d["attribute"].split(";")]
+
+
+class LegacyGFFAttribute(object):
+    def __init__(self, attribute_str):
+        p = re.compile(r"""(.*)=(.*)""")
+        m = p.match(attribute_str)
+        if m:
+            self.tag = m.groups()[0]
+            self.value = [x for x in m.groups()[1].split(",")]
+        else:
+            self.tag = "wat"
+            self.value = "wat"
+
+
+def write_test_gff(path, n):
+    with open(path, "w") as out:
+        out.write("##gff-version 3\n")
+        for i in range(n // 4):
+            s = 1000 + i * 100
+            out.write("chr1\tbench\tgene\t{}\t{}\t.\t+\t.\tID=gene{};Name=G{};Note=some%2C note\n".format(s, s + 90, i, i))
+            out.write("chr1\tbench\tmRNA\t{}\t{}\t.\t+\t.\tID=mrna{};Parent=gene{}\n".format(s, s + 90, i, i))
+            out.write("chr1\tbench\texon\t{}\t{}\t0.5\t+\t.\tID=exon{};Parent=mrna{}\n".format(s, s + 90, i, i))
+            out.write("chr1\tbench\tCDS\t{}\t{}\t.\t+\t0\tID=cds{};Parent=mrna{}\n".format(s + 10, s + 60, i, i))
+
+
+def bench(name, lines, fun):
+    t = time.time()
+    for l in lines:
+        fun(l)
+    dt = time.time() - t
+    print("{:<45} {:>12,.0f} lines/sec".format(name, len(lines) / dt))
+
+
+def id_and_parent(l):
+    o = gh.GFFObject(l)
+    return o.get_ID(), o.get_Parent()
+
+
+def all_attributes(l):
+    return gh.GFFObject(l).attributes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--gff", type=str, help="gff3 file to use instead of a generated one")
+    args = parser.parse_args()
+    path = args.gff
+    if not path:
+        fd, path = tempfile.mkstemp(suffix=".gff3")
+        os.close(fd)
+        write_test_gff(path, args.lines)
+    with open(path) as f:
+        lines = [l.strip() for l in f if l.strip() and not l.startswith("#")]
+    if not args.gff:
+        os.remove(path)
+
+    bench("before: GFFObject (eager, regex)", lines, LegacyGFFObject)
+    bench("after: GFFObject", lines, gh.GFFObject)
+    bench("after: GFFObject + get_ID/get_Parent", lines, id_and_parent)
+    bench("after: GFFObject + all attributes", lines, all_attributes)
+    bench("after: gfftokenizer.split_gffline", lines, gt.split_gffline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+asyncio versions of the gff and fasta readers, for use in event loop based services.
+
+The blocking readers run in a thread (the loop's default executor unless one is given),
+one step per batch of records, so the event loop only waits for whole batches and is free in between.
+Reading is driven by the consumer: the next batch is only read when it is asked for,
+so slow consumers hold back the reader instead of piling up parsed records.
+Cancelling the consuming task (or leaving the async for early) stops reading and closes the file
+once the batch currently being read in the thread is done.
+
+    async for batch in aread_gff_file("annotation.gff3.gz", batch_size=5000):
+        for obj in batch:
+            ...
+"""
+from __future__ import print_function # python 2
+import asyncio
+from itertools import islice
+import dustdas.fastahelper as fh
+from dustdas import gffhelper as gh
+
+
+def _batches(iterable, batch_size):
+    it = iter(iterable)
+    try:
+        while True:
+            batch = list(islice(it, batch_size))
+            if not batch:
+                return
+            yield batch
+    finally:
+        if hasattr(it, "close"):
+            it.close()  # e.g. a reader's finally, closing its file
+
+
+async def _abatches(iterable, batch_size, executor=None):
+    """yield lists of up to batch_size items of the blocking iterable, each list read in executor"""
+    loop = asyncio.get_running_loop()
+    batches = _batches(iterable, batch_size)
+    pending = None
+    try:
+        while True:
+            pending = loop.run_in_executor(executor, next, batches, None)
+            # shielded, so cancelling the consumer leaves pending running until the thread is done
+            batch = await asyncio.shield(pending)
+            if batch is None:
+                return
+            yield batch
+    finally:
+        if pending is not None and not pending.done():
+            # the thread is still reading, the generator can only be closed after it is done
+            pending.add_done_callback(lambda f: _close(f, batches))
+        else:
+            batches.close()
+
+
+def _close(future, batches):
+    if not future.cancelled():
+        future.exception()  # retrieved, the consumer is gone
+    batches.close()
+
+
+def aread_gff_file(infile, typed=False, batch_size=1000, executor=None):
+    """async iterator over lists of up to batch_size GFFObjects of infile, see gffhelper.read_gff_file"""
+    return _abatches(gh.read_gff_file(infile, typed=typed), batch_size, executor)
+
+
+def aread_fasta(fasta, batch_size=100, executor=None):
+    """async iterator over lists of up to batch_size (header, sequence) of fasta, see FastaParser.read_fasta"""
+    return _abatches(fh.FastaParser.read_fasta(fasta), batch_size, executor)
@@ -0,0 +1,363 @@
+"""
+BGZF (blocked gzip, as written by bgzip) support.
+
+A BGZF file is a series of independent gzip members ("blocks") of at most 64 kb uncompressed data,
+each recording its own compressed size in a gzip extra field. A position in the file is a virtual
+offset: compressed offset of the block << 16 | offset within the uncompressed block.
+The .gzi index (bgzip -i / -r) maps compressed block offsets to uncompressed offsets,
+so plain uncompressed offsets (as used in .fai indices) can be located without decompressing
+everything before them.
+"""
+from __future__ import print_function # python 2
+import io
+import os
+import struct
+import zlib
+from bisect import bisect_left, bisect_right
+
+GZIP_MAGIC = b"\x1f\x8b"
+BGZF_HEADER = b"\x1f\x8b\x08\x04"
+BGZF_MAX_BLOCK_SIZE = 0x10000
+# bgzip's uncompressed payload per block, leaves room for incompressible data in a 64 kb block
+BGZF_BLOCK_DATA_SIZE = 0xff00
+BGZF_EOF = (b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43"
+            b"\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+
+def is_bgzf(path):
+    """True if path starts with a gzip member carrying the BGZF 'BC' extra field"""
+    with open(path, "rb") as f:
+        header = f.read(18)
+    return (len(header) == 18 and header[:4] == BGZF_HEADER
+            and header[12:14] == b"BC" and header[14:16] == b"\x02\x00")
+
+
+def is_gzip(path):
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def make_virtual_offset(coffset, within_block):
+    return coffset << 16 | within_block
+
+
+def split_virtual_offset(voffset):
+    return voffset >> 16, voffset & 0xffff
+
+
+def read_or_build(path, sidecar, read, build, write=True):
+    """
+    read(sidecar) if sidecar is present and not older than path, otherwise build() (and write the result to sidecar
+    with its write method, if write is True). read may return None to have an outdated sidecar rebuilt
+    """
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+        idx = read(sidecar)
+        if idx is not None:
+            return idx
+    idx = build()
+    if write:
+        try:
+            idx.write(sidecar)
+        except (IOError, OSError):
+            pass  # read-only location, keep it in memory only
+    return idx
+
+
+def _read_block_header(f):
+    """
+    reads the gzip header of the block at the current position of f
+    returns the total size of the block in bytes, or None at end of file
+    """
+    header = f.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or header[:4] != BGZF_HEADER:
+        raise BgzfException("not a BGZF block at offset {}".format(f.tell() - len(header)))
+    xlen, = struct.unpack("<H", header[10:12])
+    extra = f.read(xlen)
+    i = 0
+    while i + 4 <= len(extra):
+        slen, = struct.unpack("<H", extra[i + 2:i + 4])
+        if extra[i:i + 2] == b"BC" and slen == 2:
+            bsize, = struct.unpack("<H", extra[i + 4:i + 6])
+            return bsize + 1
+        i += 4 + slen
+    raise BgzfException("BGZF block without BC extra field")
+
+
+class BgzfIndex(object):
+    """
+    .gzi index: compressed and uncompressed start offsets of every block.
+    the first block (0, 0) is implicit in the file format, but kept in the lists here
+    """
+    def __init__(self, coffsets=None, uoffsets=None):
+        self.coffsets = coffsets or [0]
+        self.uoffsets = uoffsets or [0]
+
+    @staticmethod
+    def index_path(path):
+        return path + ".gzi"
+
+    @classmethod
+    def read(cls, gzi):
+        with open(gzi, "rb") as f:
+            n, = struct.unpack("<Q", f.read(8))
+            data = struct.unpack("<{}Q".format(2 * n), f.read(16 * n))
+        return cls([0] + list(data[0::2]), [0] + list(data[1::2]))
+
+    @classmethod
+    def build(cls, path):
+        """walk the block headers of path; only the 4 byte ISIZE trailer of each block is read, nothing is inflated"""
+        coffsets = [0]
+        uoffsets = [0]
+        coffset = uoffset = 0
+        with open(path, "rb") as f:
+            while True:
+                f.seek(coffset)
+                bsize = _read_block_header(f)
+                if bsize is None:
+                    break
+                f.seek(coffset + bsize - 4)
+                isize, = struct.unpack("<I", f.read(4))
+                coffset += bsize
+                uoffset += isize
+                coffsets.append(coffset)
+                uoffsets.append(uoffset)
+        # the last entry is the end of the file, not a block
+        return cls(coffsets[:-1], uoffsets[:-1])
+
+    @classmethod
+    def for_bgzf(cls, path, write=True):
+        """read path's .gzi if present and up to date, otherwise build it (and write it, if write is True)"""
+        return read_or_build(path, cls.index_path(path), cls.read, lambda: cls.build(path), write=write)
+
+    def write(self, gzi):
+        with open(gzi, "wb") as out:
+            out.write(struct.pack("<Q", len(self.coffsets) - 1))
+            for c, u in zip(self.coffsets[1:], self.uoffsets[1:]):
+                out.write(struct.pack("<QQ", c, u))
+
+    def virtual_offset(self, uoffset):
+        """virtual offset of the uncompressed offset uoffset"""
+        i = bisect_right(self.uoffsets, uoffset) - 1
+        return make_virtual_offset(self.coffsets[i], uoffset - self.uoffsets[i])
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    binary reader for BGZF files with random access.
+    seek/tell use uncompressed offsets (needs the .gzi index, built on first use if missing),
+    seek_virtual/tell_virtual use BGZF virtual offsets (as stored in .tbi indices).
+    readline works on whole blocks, so iterating lines is reasonably fast
+    """
+    def __init__(self, path, index=None):
+        super(BgzfReader, self).__init__()
+        self._path = path
+        self._handle = open(path, "rb")
+        self._index = index
+        self._coffset = 0  # compressed offset of the loaded block
+        self._next_coffset = 0
+        self._uoffset = 0  # uncompressed offset of the loaded block, if known
+        self._data = b""
+        self._pos = 0
+        self._load_block(0, 0)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = BgzfIndex.for_bgzf(self._path)
+        return self._index
+
+    def _load_block(self, coffset, uoffset=None):
+        """inflate the block at coffset; uoffset is its uncompressed offset, if known"""
+        self._handle.seek(coffset)
+        bsize = _read_block_header(self._handle)
+        if bsize is None:
+            data = b""
+            bsize = 0
+        else:
+            self._handle.seek(coffset)
+            block = self._handle.read(bsize)
+            xlen, = struct.unpack("<H", block[10:12])
+            data = zlib.decompress(block[12 + xlen:-8], -15)
+        self._coffset = coffset
+        self._next_coffset = coffset + bsize
+        self._uoffset = uoffset
+        self._data = data
+        self._pos = 0
+        return bool(bsize)
+
+    def _next_block(self):
+        """load the following non-empty block, False at end of file"""
+        while True:
+            uoffset = None if self._uoffset is None else self._uoffset + len(self._data)
+            if not self._load_block(self._next_coffset, uoffset):
+                return False
+            if self._data:
+                return True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek_virtual(self, voffset):
+        coffset, within = split_virtual_offset(voffset)
+        if coffset != self._coffset or not self._data:
+            self._load_block(coffset, 0 if coffset == 0 else None)
+        self._pos = within
+        return voffset
+
+    def tell_virtual(self):
+        if self._pos == len(self._data) and self._data:
+            # at the end of a block, the same position is the start of the next one
+            return make_virtual_offset(self._next_coffset, 0)
+        return make_virtual_offset(self._coffset, self._pos)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can only seek relative to start or current position")
+        idx = self.index
+        i = bisect_right(idx.uoffsets, offset) - 1
+        if self._coffset != idx.coffsets[i] or self._uoffset != idx.uoffsets[i]:
+            self._load_block(idx.coffsets[i], idx.uoffsets[i])
+        self._pos = offset - idx.uoffsets[i]
+        return offset
+
+    def tell(self):
+        if self._uoffset is None:
+            idx = self.index
+            i = bisect_left(idx.coffsets, self._coffset)
+            if i == len(idx.coffsets) or idx.coffsets[i] != self._coffset:
+                raise BgzfException("block at {} not in .gzi index".format(self._coffset))
+            self._uoffset = idx.uoffsets[i]
+        return self._uoffset + self._pos
+
+    def readinto(self, b):
+        if self._pos >= len(self._data) and not self._next_block():
+            return 0
+        n = min(len(b), len(self._data) - self._pos)
+        b[:n] = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        parts = []
+        while size > 0:
+            if self._pos >= len(self._data) and not self._next_block():
+                break
+            chunk = self._data[self._pos:self._pos + size]
+            self._pos += len(chunk)
+            size -= len(chunk)
+            parts.append(chunk)
+        return b"".join(parts)
+
+    def readall(self):
+        parts = [self._data[self._pos:]]
+        self._pos = len(self._data)
+        while self._next_block():
+            parts.append(self._data)
+            self._pos = len(self._data)
+        return b"".join(parts)
+
+    def readline(self, size=-1):
+        parts = []
+        while True:
+            if self._pos >= len(self._data) and not self._next_block():
+                break
+            i = self._data.find(b"\n", self._pos)
+            if i >= 0:
+                parts.append(self._data[self._pos:i + 1])
+                self._pos = i + 1
+                break
+            parts.append(self._data[self._pos:])
+            self._pos = len(self._data)
+        return b"".join(parts)
+
+    def close(self):
+        if not self.closed:
+            self._handle.close()
+        super(BgzfReader, self).close()
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    binary writer producing BGZF output that bgzip, samtools and tabix can read.
+    tell() is the uncompressed offset; the .gzi index can be written alongside with write_index
+    """
+    def __init__(self, path_or_handle, compresslevel=6):
+        super(BgzfWriter, self).__init__()
+        if hasattr(path_or_handle, "write"):
+            self._handle = path_or_handle
+            self._own_handle = False
+        else:
+            self._handle = open(path_or_handle, "wb")
+            self._own_handle = True
+        self._level = compresslevel
+        self._buffer = bytearray()
+        self._coffset = 0
+        self._uoffset = 0
+        self.index = BgzfIndex()
+
+    def writable(self):
+        return True
+
+    def _write_block(self, data):
+        c = zlib.compressobj(self._level, zlib.DEFLATED, -15)
+        cdata = c.compress(data) + c.flush()
+        bsize = 18 + len(cdata) + 8
+        self._handle.write(b"".join([
+            BGZF_HEADER, b"\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00",
+            struct.pack("<H", bsize - 1), cdata,
+            struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))]))
+        self._coffset += bsize
+        self._uoffset += len(data)
+        self.index.coffsets.append(self._coffset)
+        self.index.uoffsets.append(self._uoffset)
+
+    def write(self, b):
+        self._buffer.extend(b)
+        while len(self._buffer) >= BGZF_BLOCK_DATA_SIZE:
+            self._write_block(bytes(self._buffer[:BGZF_BLOCK_DATA_SIZE]))
+            del self._buffer[:BGZF_BLOCK_DATA_SIZE]
+        return len(b)
+
+    def flush(self):
+        """finish the current block, so everything written so far starts a new block"""
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer = bytearray()
+        if not self._handle.closed:
+            self._handle.flush()
+
+    def tell(self):
+        return self._uoffset + len(self._buffer)
+
+    def tell_virtual(self):
+        return make_virtual_offset(self._coffset, len(self._buffer))
+
+    def write_index(self, gzi):
+        self.index.write(gzi)
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self._handle.write(BGZF_EOF)
+            if self._own_handle:
+                self._handle.close()
+            else:
+                self._handle.flush()
+        super(BgzfWriter, self).close()
+
+
+class BgzfException(Exception):
+    pass
@@ -0,0 +1,127 @@
+"""
+counts of the feature types, seqids and sources of a gff file, without creating GFFObjects.
+
+The file is read as bytes in large blocks, every feature line is split only up to its third tab
+and the (seqid, source, type) triples are counted with a Counter; the few distinct triples are then
+decoded and summed up per column. Uncompressed and bgzip compressed files can be counted by several processes,
+and the result can be kept in a sidecar file (path.census.json) that is reused while the gff file is unchanged.
+"""
+from __future__ import print_function # python 2
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import dustdas.fastahelper as fh
+from dustdas import bgzf
+
+BLOCK_SIZE = 1 << 23
+
+
+def _count_lines(lines, triples):
+    """add (seqid, source, type) of the feature lines (bytes) to Counter triples"""
+    triples.update(tuple(l.split(b"\t", 3)[:3]) for l in lines
+                   if l and not l.startswith(b"#") and not l.isspace())
+
+
+def _count_handle(f, size=None):
+    """Counter of the triples of binary handle f, read in blocks up to size bytes (all if None)"""
+    triples = Counter()
+    rest = b""
+    while size is None or size > 0:
+        block = f.read(BLOCK_SIZE if size is None else min(BLOCK_SIZE, size))
+        if not block:
+            break
+        if size is not None:
+            size -= len(block)
+        lines = (rest + block).split(b"\n")
+        rest = lines.pop()
+        _count_lines(lines, triples)
+    _count_lines([rest], triples)
+    return triples
+
+
+def _count_range(path, start, end):
+    """Counter of the triples in [start, end) of path, run in worker processes"""
+    with fh.open_random_access(path) as f:
+        f.seek(start)
+        return _count_handle(f, None if end is None else end - start)
+
+
+class GFFCensus(object):
+    """number of features per type, seqid and source, each in order of first occurrence"""
+    def __init__(self, types=None, seqids=None, sources=None, size=None):
+        self.types = types if types is not None else {}
+        self.seqids = seqids if seqids is not None else {}
+        self.sources = sources if sources is not None else {}
+        self.size = size  # of the counted file, to recognize outdated sidecars
+
+    @classmethod
+    def from_triples(cls, triples):
+        census = cls()
+        for triple, n in triples.items():
+            if len(triple) < 3:
+                continue
+            seqid, source, type = (c.decode().strip() for c in triple)
+            census.types[type] = census.types.get(type, 0) + n
+            census.seqids[seqid] = census.seqids.get(seqid, 0) + n
+            census.sources[source] = census.sources.get(source, 0) + n
+        return census
+
+    @classmethod
+    def from_lines(cls, lines):
+        """census of feature lines (str), e.g. the cached lines of a GFFFile"""
+        triples = Counter()
+        _count_lines((l.encode() for l in lines), triples)
+        return cls.from_triples(triples)
+
+    @classmethod
+    def count(cls, path, parallel=None):
+        """
+        census of gff file path. with parallel=N, N processes count parts of the file
+        (not for gzip or zip files that aren't bgzip compressed)
+        """
+        ranges = fh.line_ranges(path, parallel * 4) if parallel and parallel > 1 else None
+        if ranges is not None and len(ranges) > 1:
+            triples = Counter()
+            with ProcessPoolExecutor(max_workers=parallel) as executor:
+                futures = [executor.submit(_count_range, path, start, end) for start, end in ranges]
+                for future in futures:
+                    triples.update(future.result())
+            return cls.from_triples(triples)
+        with fh.binary_open(path) as f:
+            return cls.from_triples(_count_handle(f))
+
+    @staticmethod
+    def sidecar_path(path):
+        return path + ".census.json"
+
+    @classmethod
+    def for_gff(cls, path, parallel=None, write=True):
+        """read path's sidecar if present and up to date, otherwise count (and write the sidecar, if write is True)"""
+        size = os.path.getsize(path)
+
+        def read(sidecar):
+            try:
+                census = cls.read(sidecar)
+            except (ValueError, KeyError):
+                return None  # damaged, count again
+            return census if census.size == size else None
+
+        def count():
+            census = cls.count(path, parallel=parallel)
+            census.size = size
+            return census
+        return bgzf.read_or_build(path, cls.sidecar_path(path), read, count, write=write)
+
+    @classmethod
+    def read(cls, sidecar):
+        with open(sidecar) as f:
+            d = json.load(f)
+        # lists of pairs, to keep the order of first occurrence
+        return cls(dict(d["types"]), dict(d["seqids"]), dict(d["sources"]), d["size"])
+
+    def write(self, sidecar):
+        d = {"size": self.size, "types": list(self.types.items()),
+             "seqids": list(self.seqids.items()), "sources": list(self.sources.items())}
+        with open(sidecar, 'w') as out:
+            json.dump(d, out)
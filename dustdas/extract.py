@@ -0,0 +1,198 @@
+"""
+spliced transcript, CDS and protein sequences of all transcripts of a gff file, like gffread -w/-x/-y.
+
+Transcripts are the features with exon or CDS children (found through a FeatureGraph).
+They are grouped by seqid, so every chromosome is read from the fasta exactly once,
+and their sequences are written as soon as the chromosome is done.
+Exons and CDS parts are joined in genome order and reverse complemented on the minus strand,
+the CDS is trimmed by the phase of its first part in transcription order before it is translated.
+With parallel=N, seqids are processed by N worker processes. Uncompressed genomes are memory mapped
+(MmapFasta), each worker opens the genome once and maps the file, so all workers share the kernel's single copy
+of it and tasks only carry seqids and transcript models; results come back in the same order as without parallel.
+
+    python -m dustdas.extract annotation.gff3 genome.fa -w transcripts.fa -x cds.fa -y proteins.fa
+"""
+from __future__ import print_function # python 2
+import argparse
+import warnings
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import dustdas.fastahelper as fh
+from dustdas import gffhelper as gh
+from dustdas.featuregraph import FeatureGraph, feature_id
+
+# exons and the parts of each CDS (by CDS ID) as (start, end, phase), gff coordinates
+TranscriptModel = namedtuple("TranscriptModel", "id seqid strand exons cds")
+# cds: list of (name, cds sequence, protein)
+TranscriptSequences = namedtuple("TranscriptSequences", "id seqid strand transcript cds")
+
+
+def _segment(feature):
+    phase = feature.phase
+    if phase in (None, "."):
+        phase = 0
+    return int(feature.start), int(feature.end), int(phase)
+
+
+def transcript_models(graph):
+    """TranscriptModel of every feature of FeatureGraph graph that has exon or CDS children, in file order"""
+    for fid in graph.ids():
+        children = graph.children(fid)
+        exons = sorted(_segment(c) for c in children if c.type == "exon")
+        cds = OrderedDict()
+        for c in children:
+            if c.type == "CDS":
+                cds.setdefault(feature_id(c), []).append(_segment(c))
+        if not exons and not cds:
+            continue
+        for parts in cds.values():
+            parts.sort()
+        if not exons:
+            # e.g. gene -> CDS without mRNA and exons: the CDS is the transcript
+            exons = sorted(set(p for parts in cds.values() for p in parts))
+        feature = graph.feature(fid)
+        strand = feature.strand
+        if strand not in ("+", "-"):
+            strand = next((c.strand for c in children if c.strand in ("+", "-")), strand)
+        yield TranscriptModel(fid, feature.seqid, strand, exons, cds)
+
+
+def spliced(chromosome, segments, strand):
+    """joined sequence of the (start, end, ...) segments (gff coordinates, sorted) of chromosome, a str"""
+    seq = "".join([chromosome[s[0] - 1:s[1]] for s in segments])
+    if strand == "-":
+        return fh.FastaHelper.reverse_complement(seq)
+    return seq
+
+
+def model_sequences(model, chromosome, table=1):
+    """TranscriptSequences of TranscriptModel model, chromosome is the whole sequence of its seqid"""
+    cds = []
+    for cds_id, parts in model.cds.items():
+        seq = spliced(chromosome, parts, model.strand)
+        first = parts[-1] if model.strand == "-" else parts[0]
+        seq = seq[first[2]:]
+        name = model.id if len(model.cds) == 1 or cds_id is None else cds_id
+        cds.append((name, seq, fh.SeqTranslator.dna2prot(seq, table=table)))
+    return TranscriptSequences(model.id, model.seqid, model.strand,
+                               spliced(chromosome, model.exons, model.strand), cds)
+
+
+def _open_fasta(fasta):
+    if not isinstance(fasta, str):
+        return fasta
+    for cls in (fh.MmapFasta, fh.IndexedFasta):
+        try:
+            return cls(fasta)
+        except fh.FastaIndexException:
+            pass
+    # plain gzip, no random access
+    return {h.split()[0]: s for h, s in fh.FastaParser.read_fasta(fasta)}
+
+
+def models_by_seqid(gff):
+    """TranscriptModels of gff (GFFFile or path) grouped by seqid, seqids in order of first appearance"""
+    if not isinstance(gff, gh.GFFFile):
+        gff = gh.GFFFile(gff)
+    by_seqid = OrderedDict()
+    for model in transcript_models(FeatureGraph.from_gff_file(gff)):
+        by_seqid.setdefault(model.seqid, []).append(model)
+    return by_seqid
+
+
+def extract_sequences(gff, fasta, table=1, parallel=None):
+    """
+    yield TranscriptSequences for all transcripts of gff (GFFFile or path), seqid by seqid.
+    fasta is a path, a dict (first header word: sequence) or an IndexedFasta.
+    parallel=N extracts N seqids at a time in worker processes, the output stays the same
+    """
+    genome = _open_fasta(fasta)
+    groups = []
+    for seqid, models in models_by_seqid(gff).items():
+        if seqid not in genome:
+            warnings.warn("{} is not in the fasta file, skipping {} transcripts".format(seqid, len(models)))
+        else:
+            groups.append((seqid, models))
+    try:
+        if parallel and parallel > 1 and len(groups) > 1:
+            # workers open an indexed genome once (see _init_worker) and get only seqids and models,
+            # chromosomes of other genomes are sent with their task
+            shared = genome if isinstance(genome, fh.IndexedFasta) else None
+            chunksize = max(1, len(groups) // (parallel * 4))
+            with ProcessPoolExecutor(max_workers=parallel, initializer=_init_worker,
+                                     initargs=(shared, table)) as executor:
+                tasks = ((seqid, None if shared is not None else str(genome[seqid]), models)
+                         for seqid, models in groups)
+                for res in executor.map(_extract_seqid, tasks, chunksize=chunksize):
+                    for t in res:
+                        yield t
+        else:
+            for seqid, models in groups:
+                chromosome = str(genome[seqid])
+                for model in models:
+                    yield model_sequences(model, chromosome, table=table)
+    finally:
+        if genome is not fasta and hasattr(genome, "close"):
+            genome.close()
+
+
+# genome and genetic code of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(genome, table):
+    """keep the genome (an IndexedFasta, reopened from its path when unpickled) and table for all tasks"""
+    _worker["genome"] = genome
+    _worker["table"] = table
+
+
+def _extract_seqid(task):
+    """TranscriptSequences of the models of one seqid, run in worker processes"""
+    seqid, chromosome, models = task
+    if chromosome is None:
+        chromosome = str(_worker["genome"][seqid])
+    return [model_sequences(model, chromosome, table=_worker["table"]) for model in models]
+
+
+def write_sequences(gff, fasta, transcripts=None, cds=None, proteins=None, table=1, width=60, parallel=None):
+    """
+    write spliced transcripts, CDS and proteins of gff to the files (paths or open handles) given,
+    returns the number of transcripts
+    """
+    out_transcripts, out_cds, out_proteins = [None if out is None else fh.FastaWriter(out, width=width)
+                                              for out in (transcripts, cds, proteins)]
+    n = 0
+    try:
+        for t in extract_sequences(gff, fasta, table=table, parallel=parallel):
+            n += 1
+            if out_transcripts is not None:
+                out_transcripts.write(t.id, t.transcript)
+            for name, seq, protein in t.cds:
+                if out_cds is not None:
+                    out_cds.write(name, seq)
+                if out_proteins is not None:
+                    out_proteins.write(name, protein)
+    finally:
+        for out in (out_transcripts, out_cds, out_proteins):
+            if out is not None:
+                out.close()
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write transcript, CDS and protein sequences of a gff file")
+    parser.add_argument("gff", type=str, help="path to gff file")
+    parser.add_argument("fasta", type=str, help="path to genome fasta file")
+    parser.add_argument("-w", dest="transcripts", help="write spliced transcripts to this file")
+    parser.add_argument("-x", dest="cds", help="write CDS to this file")
+    parser.add_argument("-y", dest="proteins", help="write proteins to this file")
+    parser.add_argument("--table", default=1, help="NCBI genetic code (default: 1)")
+    parser.add_argument("--width", type=int, default=60, help="line width, 0 for no line breaks (default: 60)")
+    parser.add_argument("-p", "--parallel", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+    write_sequences(args.gff, args.fasta, args.transcripts, args.cds, args.proteins, args.table, args.width,
+                    args.parallel)
+
+
+if __name__ == "__main__":
+    main()
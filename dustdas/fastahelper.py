@@ -1,36 +1,107 @@
 from __future__ import print_function # python 2
+import bisect
 import gzip
 import zipfile
 import io
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from dustdas import bgzf
+from dustdas import geneticcode as gc
+from dustdas.geneticcode import codon_index, codon_indices, as_bytes
+from collections import OrderedDict, namedtuple
+try:
+    from collections.abc import Mapping
+except ImportError:  # python 2
+    from collections import Mapping
 
 
 def text_or_gzip_open(path, mode='r'):
     """tries to open file as gzip, zip, then text"""
-    try:
-        # check if we can open and read the file as a gzip file
-        with gzip.open(path, 'r') as tmp:
-            tmp.read(1)  # because gzip won't throw an error until read
-
-        # if so, open it again, this time to return
+    # recognize gzip by its magic bytes, instead of inflating the first block to find out
+    if bgzf.is_gzip(path):
         mode += "t"  # maintains same functionality as opening text file
         f = gzip.open(path, mode)
 
-    except gzip.BadGzipFile:
-        # next try zip
-        try:
-            with zipfile.ZipFile(path) as f_archive:
-                file_names = f_archive.namelist()
-                assert len(file_names) == 1, "only zip files with single component are supported"
-                f = io.TextIOWrapper(f_archive.open(file_names[0], mode))
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as f_archive:
+            file_names = f_archive.namelist()
+            assert len(file_names) == 1, "only zip files with single component are supported"
+            f = io.TextIOWrapper(f_archive.open(file_names[0], mode))
 
-        except zipfile.BadZipFile:
-            # finally assume text
-            # last because the unicode error is most cryptic
-            f = open(path, mode)
+    else:
+        # finally assume text
+        # last because the unicode error is most cryptic
+        f = open(path, mode)
 
     return f
 
 
+def open_random_access(path):
+    """
+    binary handle supporting seek/read on uncompressed offsets:
+    a BgzfReader for bgzip compressed files, the plain file otherwise.
+    files compressed with ordinary gzip can't be accessed randomly
+    """
+    if bgzf.is_bgzf(path):
+        return bgzf.BgzfReader(path)
+    if bgzf.is_gzip(path):
+        raise FastaIndexException("{} is gzip compressed, random access needs bgzip compression".format(path))
+    return open(path, "rb")
+
+
+def binary_open(path):
+    """like text_or_gzip_open, but returns a binary handle"""
+    if bgzf.is_gzip(path):
+        return gzip.open(path, 'rb')
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as f_archive:
+            file_names = f_archive.namelist()
+            assert len(file_names) == 1, "only zip files with single component are supported"
+            return f_archive.open(file_names[0])
+    return open(path, 'rb')
+
+
+def line_ranges(path, n):
+    """
+    about n [start, end) ranges of uncompressed offsets covering path, each starting at a line start
+    end None means end of file. None for files without random access (gzip, zip)
+    """
+    if bgzf.is_bgzf(path):
+        index = bgzf.BgzfIndex.for_bgzf(path)
+        blocks = index.uoffsets
+        candidates = [blocks[i * len(blocks) // n] for i in range(1, n)]
+    elif bgzf.is_gzip(path) or zipfile.is_zipfile(path):
+        return None
+    else:
+        size = os.path.getsize(path)
+        candidates = [i * size // n for i in range(1, n)]
+    starts = [0]
+    with open_random_access(path) as f:
+        for c in candidates:
+            if c <= starts[-1]:
+                continue
+            # first line starting at or after c
+            f.seek(c - 1)
+            if not f.readline():
+                break
+            pos = f.tell()
+            if pos > starts[-1]:
+                starts.append(pos)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+# complements of the IUPAC nucleotide codes (U pairs with A), other characters are kept
+_IUPAC = "ACGTUMRWSYKVHDBN"
+_IUPAC_COMPLEMENT = "TGCAAKYWSRMBDHVN"
+COMPLEMENT = str.maketrans(_IUPAC + _IUPAC.lower(), _IUPAC_COMPLEMENT + _IUPAC_COMPLEMENT.lower())
+COMPLEMENT_BYTES = bytes.maketrans((_IUPAC + _IUPAC.lower()).encode(),
+                                   (_IUPAC_COMPLEMENT + _IUPAC_COMPLEMENT.lower()).encode())
+
+
 class FastaHelper(object):
     @staticmethod
     def remove_newlines(s):
@@ -42,15 +113,24 @@ class FastaHelper(object):
 
     @staticmethod
     def complement(s):
-        tr = str.maketrans('AGTCagtc', 'TCAGtcag')
-        res = s.translate(tr)
-        return res
+        """complement of s (str, bytes or bytearray), IUPAC codes included, case is kept"""
+        if isinstance(s, (bytes, bytearray)):
+            return s.translate(COMPLEMENT_BYTES)
+        return s.translate(COMPLEMENT)
 
     @staticmethod
     def reverse_complement(s):
-        tr = str.maketrans('AGTCagtc', 'TCAGtcag')
-        res = s.translate(tr)
-        return res[::-1]
+        """reverse complement of s (str, bytes or bytearray)"""
+        if isinstance(s, (bytes, bytearray)):
+            return s.translate(COMPLEMENT_BYTES)[::-1]
+        return s.translate(COMPLEMENT)[::-1]
+
+    @staticmethod
+    def reverse_complement_many(seqs):
+        """list of the reverse complements of seqs, all str or all bytes"""
+        seqs = list(seqs)
+        table = COMPLEMENT_BYTES if seqs and isinstance(seqs[0], (bytes, bytearray)) else COMPLEMENT
+        return [s.translate(table)[::-1] for s in seqs]
 
 
 class FastaParser(object):
@@ -79,6 +159,61 @@ class FastaParser(object):
             yield (line.rstrip(), joinedSeq.rstrip())
         fasta.close()
 
+    @staticmethod
+    def read_fasta_blocks(fasta, binary=False, block_size=1 << 22):
+        """
+        like read_fasta, but reads the file as bytes in blocks of block_size and splits each block
+        once at the record starts (b"\\n>"), so there is no python work per line.
+        yields (header, sequence) as str, or as bytes with binary=True.
+        line ends (\\n or \\r\\n) and blank lines are removed from sequences,
+        anything before the first header is skipped
+        """
+        for data in FastaParser._record_blocks(fasta, block_size):
+            if binary:
+                for r in data[1:].split(b"\n>"):
+                    header, _, seq = r.partition(b"\n")
+                    yield header.rstrip(), seq.translate(None, b"\r\n")
+            else:
+                data = data.decode()  # once per block
+                crlf = "\r" in data
+                for r in data[1:].split("\n>"):
+                    header, _, seq = r.partition("\n")
+                    seq = seq.replace("\n", "")
+                    if crlf:
+                        seq = seq.replace("\r", "")
+                    yield header.rstrip(), seq
+
+    @staticmethod
+    def _record_blocks(fasta, block_size):
+        """yield bytes holding complete records of fasta, each starting with '>'"""
+        with binary_open(fasta) as f:
+            pending = []
+            first = True
+            while True:
+                block = f.read(block_size)
+                if block:
+                    cut = block.rfind(b"\n>")
+                    if cut >= 0:
+                        data = b"".join(pending) + block[:cut]
+                        pending = [block[cut + 1:]]
+                    elif block.startswith(b">") and pending and pending[-1].endswith(b"\n"):
+                        data = b"".join(pending)
+                        pending = [block]
+                    else:
+                        pending.append(block)
+                        continue
+                else:
+                    data = b"".join(pending)
+                if first and not data.startswith(b">"):
+                    # skip anything before the first header
+                    i = data.find(b"\n>")
+                    data = data[i + 1:] if i >= 0 else b""
+                if data:
+                    first = False
+                    yield data
+                if not block:
+                    return
+
     @staticmethod
     def read_fasta_whole(fasta):
         """
@@ -97,90 +232,851 @@ class FastaParser(object):
         if strand is -, return the reverse complement of the subsequence
         unless no_reverse_complement is set to True
         """
+        if strand not in ("-", "+", "."):
+            raise StrandOrientationException("strand in unknown orientation.")
         start = int(start) - 1  # translate gff coordinates
         end = int(end)
         res = orig_seq[start:end]
 
         if strand == "-" and not no_reverse_complement:
-            res = orig_seq[start:end]
             return FastaHelper.reverse_complement(res)
-        if strand not in ["-","+","."]:
+        return res
+
+
+class FastaLookup(Mapping):
+    """
+    (header, sequence) pairs by a key computed once per header:
+    its first word by default, key(header) for a callable key, or for a regex key
+    its first group (the whole match if it has no groups); headers giving None or not matching are left out.
+    the first header wins if several have the same key.
+    fasta is a dict (header: sequence, e.g. from FastaParser.read_fasta_whole), an IndexedFasta or a path.
+    the caller owns the lookup and the sequences it holds, e.g. one per annotation run
+    """
+
+    def __init__(self, fasta, key=None):
+        if isinstance(fasta, str):
+            fasta = OrderedDict(FastaParser.read_fasta(fasta))
+        self.sequences = fasta
+        self._key = self._key_function(key)
+        self._by_key = {}
+        for header in fasta:
+            k = self._key(header)
+            if k is not None and k not in self._by_key:
+                self._by_key[k] = header
+        self._matches = {}
+
+    @staticmethod
+    def _key_function(key):
+        if key is None:
+            return lambda header: header.split(None, 1)[0] if header.strip() else None
+        if callable(key):
+            return key
+        pattern = re.compile(key)
+
+        def regex_key(header):
+            m = pattern.match(header)
+            if m is None:
+                return None
+            return m.group(1) if pattern.groups else m.group(0)
+        return regex_key
+
+    def match(self, regex):
+        """first (header, sequence) in file order whose header matches regex, None if there is none"""
+        if regex not in self._matches:
+            p = re.compile(regex)
+            self._matches[regex] = next(((h, self.sequences[h]) for h in self.sequences if p.match(h)), None)
+        return self._matches[regex]
+
+    def __getitem__(self, key):
+        header = self._by_key[key]
+        return header, self.sequences[header]
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def __iter__(self):
+        return iter(self._by_key)
+
+    def __len__(self):
+        return len(self._by_key)
+
+
+class FastaIndexRecord(namedtuple("FastaIndexRecord", "name length offset linebases linewidth")):
+    """one line of a samtools .fai index"""
+    __slots__ = ()
+
+    def byte_offset(self, pos):
+        """byte offset in the fasta file of the 0-based sequence position pos"""
+        if self.linebases == 0:
+            return self.offset
+        return self.offset + (pos // self.linebases) * self.linewidth + pos % self.linebases
+
+
+class FastaIndex(object):
+    """
+    samtools-compatible fasta index (.fai)
+    one record per sequence: name, length, offset of first base, bases per line, bytes per line
+    """
+    def __init__(self, records=None):
+        self._records = OrderedDict()
+        for r in records or []:
+            self._records[r.name] = r
+
+    @staticmethod
+    def index_path(fasta):
+        return fasta + ".fai"
+
+    @classmethod
+    def read(cls, fai):
+        records = []
+        with open(fai, "r") as f:
+            for l in f:
+                if l.strip() == "":
+                    continue
+                cols = l.rstrip("\n").split("\t")
+                if len(cols) < 5:
+                    raise FastaIndexException("malformed fai line: {}".format(l.rstrip()))
+                records.append(FastaIndexRecord(cols[0], *[int(c) for c in cols[1:5]]))
+        return cls(records)
+
+    @classmethod
+    def build(cls, fasta):
+        """scan fasta file 'fasta' (plain or bgzip compressed) once and compute the index"""
+        with open_random_access(fasta) as f:
+            records = cls._scan(f)
+        return cls(records)
+
+    @staticmethod
+    def _scan(f):
+        records = []
+        name = None
+        offset = pos = length = linebases = linewidth = 0
+        short_line = False  # seen a line shorter than linebases, must be the last one
+
+        def finish():
+            records.append(FastaIndexRecord(name, length, offset, linebases, linewidth))
+
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    finish()
+                fields = line[1:].split(None, 1)
+                name = fields[0].decode() if fields else ""
+                pos += len(line)
+                offset = pos
+                length = linebases = linewidth = 0
+                short_line = False
+                continue
+            if name is None:
+                if line.strip():
+                    raise FastaIndexException("sequence data before first header")
+                pos += len(line)
+                continue
+            bases = len(line.rstrip(b"\r\n"))
+            if bases == 0:
+                short_line = True
+            elif short_line:
+                raise FastaIndexException("different line length in sequence '{}'".format(name))
+            elif linebases == 0:
+                linebases = bases
+                linewidth = len(line)
+            elif bases > linebases or (bases == linebases and len(line) != linewidth):
+                raise FastaIndexException("different line length in sequence '{}'".format(name))
+            elif bases < linebases:
+                short_line = True
+            length += bases
+            pos += len(line)
+        if name is not None:
+            finish()
+        return records
+
+    @classmethod
+    def for_fasta(cls, fasta, write=True):
+        """read fasta's .fai if present and up to date, otherwise build it (and write it, if write is True)"""
+        return bgzf.read_or_build(fasta, cls.index_path(fasta), cls.read, lambda: cls.build(fasta), write=write)
+
+    def append(self, record):
+        """add a FastaIndexRecord"""
+        self._records[record.name] = record
+
+    def write(self, fai):
+        with open(fai, "w") as out:
+            for r in self._records.values():
+                out.write("\t".join(str(x) for x in r) + "\n")
+
+    def __getitem__(self, name):
+        return self._records[name]
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+
+class FastaWriter(object):
+    """
+    buffered fasta output with lines of width bases (0: one line per sequence),
+    to a plain, gzip or bgzip compressed (compression="gzip" or "bgzf") file, or an open handle.
+    sequences are wrapped in blocks of lines joined from memoryview slices, so no wrapped copy of a whole sequence is built.
+    with index=True (or the .fai path) a samtools .fai index is kept while writing and written on close,
+    for bgzf output together with the .gzi, so the file can be opened as IndexedFasta right away
+    """
+    LINES_PER_BLOCK = 1024
+
+    def __init__(self, path_or_handle, width=60, compression=None, index=False, buffer_size=1 << 20, compresslevel=6):
+        self.width = width
+        self._bgzf = None
+        self._own_handle = not hasattr(path_or_handle, "write")
+        if index and (compression == "gzip" or (index is True and not self._own_handle)):
+            raise FastaIndexException("can only index plain or bgzip compressed files written to a path")
+        if not self._own_handle:
+            if compression is not None:
+                raise FastaIndexException("compression needs a path, not a handle")
+            self._handle = path_or_handle
+        elif compression is None:
+            self._handle = open(path_or_handle, "wb", buffering=buffer_size)
+        elif compression == "gzip":
+            self._handle = io.BufferedWriter(gzip.open(path_or_handle, "wb", compresslevel=compresslevel), buffer_size)
+        elif compression == "bgzf":
+            self._bgzf = bgzf.BgzfWriter(path_or_handle, compresslevel=compresslevel)
+            self._handle = self._bgzf
+        else:
+            raise FastaIndexException("unknown compression {}".format(compression))
+        if isinstance(self._handle, io.TextIOBase):
+            text = self._handle
+            self._write = lambda b: text.write(bytes(b).decode())
+        else:
+            self._write = self._handle.write
+        self._fai = None
+        if index:
+            self._fai = FastaIndex.index_path(path_or_handle) if index is True else index
+        self._gzi = bgzf.BgzfIndex.index_path(path_or_handle) if index and self._bgzf is not None else None
+        self.index = FastaIndex() if index else None
+        self._offset = 0
+
+    def write(self, header, seq):
+        """write one record, header without '>', seq as str, bytes or bytearray"""
+        header = header.encode() if isinstance(header, str) else bytes(header)
+        if isinstance(seq, str):
+            seq = seq.encode()
+        head = b">" + header + b"\n"
+        self._write(head)
+        self._offset += len(head)
+        start = self._offset
+        n = len(seq)
+        width = self.width if self.width and self.width > 0 else max(n, 1)
+        view = memoryview(seq)
+        block = width * self.LINES_PER_BLOCK
+        for b in range(0, n, block):
+            chunk = b"\n".join([view[i:i + width] for i in range(b, min(b + block, n), width)]) + b"\n"
+            self._write(chunk)
+            self._offset += len(chunk)
+        if self.index is not None:
+            name = header.split(None, 1)[0].decode() if header.strip() else ""
+            # like samtools, the length of the first line, which is shorter than width for short records
+            linebases = min(width, n)
+            self.index.append(FastaIndexRecord(name, n, start, linebases, linebases + 1 if n else 0))
+
+    def write_many(self, records):
+        """write (header, seq) pairs, returns their number"""
+        count = 0
+        for header, seq in records:
+            self.write(header, seq)
+            count += 1
+        return count
+
+    def close(self):
+        if self._own_handle:
+            self._handle.close()
+        else:
+            self._handle.flush()
+        if self._gzi is not None:
+            self._bgzf.write_index(self._gzi)
+        if self._fai is not None:
+            self.index.write(self._fai)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class IndexedSequence(object):
+    """
+    lazy sequence of one record of an IndexedFasta
+    slicing (python coordinates) reads only the requested bases from disk
+    """
+    def __init__(self, fasta, record):
+        self._fasta = fasta
+        self._record = record
+
+    @property
+    def name(self):
+        return self._record.name
+
+    def __len__(self):
+        return self._record.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._record.length)
+            if step == 1:
+                return self._fasta._fetch(self._record, start, stop)
+            return self._fasta._fetch(self._record, 0, self._record.length)[key]
+        if key < 0:
+            key += self._record.length
+        if not 0 <= key < self._record.length:
+            raise IndexError("sequence index out of range")
+        return self._fasta._fetch(self._record, key, key + 1)
+
+    def __str__(self):
+        return self._fasta._fetch(self._record, 0, self._record.length)
+
+    def get_bytes(self, start, end):
+        """bases [start, end) (python coordinates, not negative) as bytes, without decoding"""
+        return self._fasta._fetch_bytes(self._record, start, end)
+
+    def __repr__(self):
+        return "<IndexedSequence {} length:{}>".format(self._record.name, self._record.length)
+
+
+class IndexedFasta(Mapping):
+    """
+    random access to a fasta file via its .fai index
+    bgzip compressed files are supported through their .gzi index (both are built if missing)
+    behaves like the dict returned by FastaParser.read_fasta_whole (name: sequence),
+    but sequences are IndexedSequence objects that are only read when sliced,
+    so they can be passed to FastaParser.get_sequence_by_coordinates and GFFObject.get_sequence.
+    keys are the sequence names as in the .fai, i.e. the first word of the header
+    """
+    def __init__(self, fasta, index=None):
+        self._path = fasta
+        if index is None:
+            index = FastaIndex.for_fasta(fasta)
+        elif not isinstance(index, FastaIndex):
+            index = FastaIndex.read(index)
+        self.index = index
+        self._handle = open_random_access(fasta)
+
+    @property
+    def path(self):
+        return self._path
+
+    def _read(self, offset, size):
+        self._handle.seek(offset)
+        return self._handle.read(size)
+
+    def _fetch_bytes(self, record, start, end):
+        """bases [start, end) (0-based, half open) of record"""
+        start = max(start, 0)
+        end = min(end, record.length)
+        if start >= end:
+            return b""
+        first = record.byte_offset(start)
+        last = record.byte_offset(end - 1) + 1
+        return self._read(first, last - first).translate(None, b"\r\n")
+
+    def _fetch(self, record, start, end):
+        return self._fetch_bytes(record, start, end).decode()
+
+    def fetch(self, seqid, start=None, end=None):
+        """sequence of seqid between start and end (gff coordinates, starting at 1, end inclusive)"""
+        record = self.index[seqid]
+        start = 0 if start is None else int(start) - 1
+        end = record.length if end is None else int(end)
+        return self._fetch(record, start, end)
+
+    def fetch_bytes(self, seqid, start=None, end=None):
+        """like fetch, but returns bytes"""
+        record = self.index[seqid]
+        start = 0 if start is None else int(start) - 1
+        end = record.length if end is None else int(end)
+        return self._fetch_bytes(record, start, end)
+
+    def header(self, seqid):
+        """whole header line of seqid (without '>'), read from just before its sequence"""
+        offset = self.index[seqid].offset
+        size = 256
+        while True:
+            start = max(offset - size, 0)
+            data = self._read(start, offset - start).rstrip(b"\r\n")
+            i = data.rfind(b"\n>")
+            if i >= 0 or start == 0:
+                return data[i + 2 if i >= 0 else 1:].decode()
+            size *= 4
+
+    def fetch_region(self, region):
+        """fetch a samtools style region string 'seqid', 'seqid:start' or 'seqid:start-end'"""
+        if region in self.index:
+            return self.fetch(region)
+        seqid, _, coords = region.rpartition(":")
+        start, _, end = coords.replace(",", "").partition("-")
+        return self.fetch(seqid, int(start), int(end) if end else None)
+
+    def close(self):
+        self._handle.close()
+
+    def __reduce__(self):
+        # reopen the file instead of pickling the handle, e.g. when sent to worker processes
+        return self.__class__, (self._path, self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, seqid):
+        return IndexedSequence(self, self.index[seqid])
+
+    def __contains__(self, seqid):
+        return seqid in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class MmapFasta(IndexedFasta):
+    """
+    IndexedFasta reading from a read-only memory map of the fasta file.
+    the mapped pages are the kernel's page cache, so processes mapping the same genome share one copy.
+    record_view gives a zero-copy memoryview over a record, fetch copies only the byte span
+    of the requested region, located by offset arithmetic from the .fai line layout
+    """
+    def __init__(self, fasta, index=None):
+        if bgzf.is_gzip(fasta):
+            raise FastaIndexException("can't memory map compressed file {}, use IndexedFasta".format(fasta))
+        super(MmapFasta, self).__init__(fasta, index=index)
+        if os.fstat(self._handle.fileno()).st_size == 0:
+            self._mmap = None
+            self._view = memoryview(b"")
+        else:
+            self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+
+    def record_view(self, seqid):
+        """
+        memoryview over the bytes of record seqid as they are in the file, newlines included.
+        release it when done, the file stays mapped after close while views on it exist
+        """
+        record = self.index[seqid]
+        if record.length == 0:
+            return self._view[record.offset:record.offset]
+        return self._view[record.offset:record.byte_offset(record.length - 1) + 1]
+
+    def _fetch_bytes(self, record, start, end):
+        start = max(start, 0)
+        end = min(end, record.length)
+        if start >= end:
+            return b""
+        first = record.byte_offset(start)
+        last = record.byte_offset(end - 1) + 1
+        # slicing the map copies just the span of the region, translate drops its line ends
+        return self._mmap[first:last].translate(None, b"\r\n")
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # record_views are still alive, the map is unmapped once the last of them is released
+                pass
+            self._mmap = None
+        super(MmapFasta, self).close()
+
+
+TWOBIT_SIGNATURE = 0x1A412743
+# 2 bits per base as in UCSC .2bit files, T=0 C=1 A=2 G=3 (the TCAG codon order), first base in the high bits
+TWOBIT_BASES = "TCAG"
+
+
+def _twobit_pack_table(shift):
+    t = bytearray(256)
+    for i, b in enumerate(TWOBIT_BASES):
+        t[ord(b)] = t[ord(b.lower())] = i << shift
+    return bytes(t)
+
+
+_TWOBIT_PACK = [_twobit_pack_table(6 - 2 * i) for i in range(4)]
+_TWOBIT_UNPACK = [bytes(ord(TWOBIT_BASES[(b >> (6 - 2 * i)) & 3]) for b in range(256)) for i in range(4)]
+# complement is xor 2 on every base (T<->A, C<->G), reversing swaps the four bases of a byte
+_TWOBIT_REVCOMP = bytes(sum((((b >> 2 * i) & 3) ^ 2) << (6 - 2 * i) for i in range(4)) for b in range(256))
+
+# name, length, starts and sizes of the N and soft-masked (lowercase) runs as array("I"),
+# packed: bytes or the memory mapped file holding the packed bases from offset on
+TwoBitRecord = namedtuple("TwoBitRecord", "name length n_starts n_sizes mask_starts mask_sizes packed offset")
+
+
+def _runs(starts, sizes, start, end):
+    """[a, b) of the sorted runs overlapping [start, end), clipped to it"""
+    i = max(bisect.bisect_right(starts, start) - 1, 0)
+    while i < len(starts) and starts[i] < end:
+        a, b = max(starts[i], start), min(starts[i] + sizes[i], end)
+        if a < b:
+            yield a, b
+        i += 1
+
+
+class PackedGenome(Mapping):
+    """
+    genome held as 2 bits per base, with N (any base but ACGT) and soft-masked (lowercase) runs kept aside,
+    in the layout of UCSC .2bit files. open() memory maps a .2bit file, so startup only reads its index
+    and records are parsed when first used; from_fasta/from_sequences pack sequences in memory.
+    fetch decodes only the requested bases, reverse complements are built on the packed bytes.
+    behaves like IndexedFasta: a mapping from name (first header word) to lazy IndexedSequence
+    """
+    def __init__(self, records=None):
+        self._index = OrderedDict((r.name, r) for r in records or ())
+        self._path = None
+        self._handle = None
+        self._mmap = None
+        self._byteorder = "<"
+
+    @staticmethod
+    def pack(name, seq):
+        """TwoBitRecord of sequence seq (str or bytes)"""
+        seq = as_bytes(seq)
+        n = (len(seq) + 3) // 4
+        padded = seq + b"T" * (4 * n - len(seq))
+        bits = 0
+        for i, table in enumerate(_TWOBIT_PACK):
+            bits |= int.from_bytes(padded[i::4].translate(table), "big")
+        runs = []
+        for pattern in (b"[^ACGTacgt]+", b"[a-z]+"):
+            starts, sizes = array("I"), array("I")
+            for m in re.finditer(pattern, seq):
+                starts.append(m.start())
+                sizes.append(m.end() - m.start())
+            runs.extend((starts, sizes))
+        return TwoBitRecord(name, len(seq), runs[0], runs[1], runs[2], runs[3], bits.to_bytes(n, "big"), 0)
+
+    @classmethod
+    def from_sequences(cls, sequences):
+        """genome of a dict name: sequence or of (name, sequence) pairs"""
+        if isinstance(sequences, Mapping):
+            sequences = sequences.items()
+        return cls(cls.pack(name, seq) for name, seq in sequences)
+
+    @classmethod
+    def from_fasta(cls, fasta):
+        """genome of fasta file fasta, names are the first words of the headers"""
+        return cls(cls.pack(h.split()[0].decode() if h.strip() else "", s)
+                   for h, s in FastaParser.read_fasta_blocks(fasta, binary=True))
+
+    @classmethod
+    def open(cls, path):
+        """memory mapped genome of .2bit file path"""
+        genome = cls()
+        genome._path = path
+        genome._handle = open(path, "rb")
+        try:
+            genome._mmap = mmap.mmap(genome._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            genome.close()
+            raise FastaIndexException("{} is not a .2bit file".format(path))
+        genome._read_index()
+        return genome
+
+    def _read_index(self):
+        for byteorder in "<>":
+            if struct.unpack_from(byteorder + "I", self._mmap, 0)[0] == TWOBIT_SIGNATURE:
+                break
+        else:
+            raise FastaIndexException("{} is not a .2bit file".format(self._path))
+        self._byteorder = byteorder
+        version, count, _ = struct.unpack_from(byteorder + "III", self._mmap, 4)
+        if version not in (0, 1):
+            raise FastaIndexException("unsupported .2bit version {} in {}".format(version, self._path))
+        offset_format = byteorder + ("Q" if version else "I")
+        pos = 16
+        for _ in range(count):
+            size = self._mmap[pos]
+            name = self._mmap[pos + 1:pos + 1 + size].decode()
+            pos += 1 + size
+            self._index[name] = struct.unpack_from(offset_format, self._mmap, pos)[0]
+            pos += struct.calcsize(offset_format)
+
+    def _read_array(self, pos, count):
+        a = array("I")
+        a.frombytes(self._mmap[pos:pos + 4 * count])
+        if self._byteorder != ("<" if sys.byteorder == "little" else ">"):
+            a.byteswap()
+        return a
+
+    def _record(self, name):
+        record = self._index[name]
+        if isinstance(record, TwoBitRecord):
+            return record
+        # offset of the record in the mapped file, parsed on first use
+        pos = record
+        length, count = struct.unpack_from(self._byteorder + "II", self._mmap, pos)
+        n_starts = self._read_array(pos + 8, count)
+        n_sizes = self._read_array(pos + 8 + 4 * count, count)
+        pos += 8 + 8 * count
+        count = struct.unpack_from(self._byteorder + "I", self._mmap, pos)[0]
+        mask_starts = self._read_array(pos + 4, count)
+        mask_sizes = self._read_array(pos + 4 + 4 * count, count)
+        pos += 4 + 8 * count + 4  # reserved word
+        record = TwoBitRecord(name, length, n_starts, n_sizes, mask_starts, mask_sizes, self._mmap, pos)
+        self._index[name] = record
+        return record
+
+    def write(self, path):
+        """write the genome as a .2bit file"""
+        records = [self._record(name) for name in self._index]
+        sizes = [16 + 8 * len(r.n_starts) + 8 * len(r.mask_starts) + (r.length + 3) // 4 for r in records]
+        index_size = sum(1 + len(r.name.encode()) + 4 for r in records)
+        version = 0 if 16 + index_size + sum(sizes) < 1 << 32 else 1
+        offset_format = "<Q" if version else "<I"
+        with open(path, "wb") as out:
+            out.write(struct.pack("<IIII", TWOBIT_SIGNATURE, version, len(records), 0))
+            offset = 16 + index_size + (4 * len(records) if version else 0)
+            for r, size in zip(records, sizes):
+                name = r.name.encode()
+                out.write(struct.pack("<B", len(name)) + name + struct.pack(offset_format, offset))
+                offset += size
+            for r in records:
+                out.write(struct.pack("<II", r.length, len(r.n_starts)))
+                for a in (r.n_starts, r.n_sizes):
+                    out.write(self._little_endian(a))
+                out.write(struct.pack("<I", len(r.mask_starts)))
+                for a in (r.mask_starts, r.mask_sizes):
+                    out.write(self._little_endian(a))
+                out.write(struct.pack("<I", 0))
+                out.write(r.packed[r.offset:r.offset + (r.length + 3) // 4])
+
+    @staticmethod
+    def _little_endian(a):
+        if sys.byteorder != "little":
+            a = array("I", a)
+            a.byteswap()
+        return a.tobytes()
+
+    def _fetch_bytes(self, record, start, end, reverse_complement=False):
+        """bases [start, end) (0-based, half open) of record, reverse complemented if reverse_complement"""
+        start = max(start, 0)
+        end = min(end, record.length)
+        if start >= end:
+            return b""
+        first, last = start // 4, (end + 3) // 4
+        # slicing copies just the packed bytes of the region, also from the map
+        packed = record.packed[record.offset + first:record.offset + last]
+        if reverse_complement:
+            packed = packed.translate(_TWOBIT_REVCOMP)[::-1]
+        bases = bytearray(4 * len(packed))
+        for i, table in enumerate(_TWOBIT_UNPACK):
+            bases[i::4] = packed.translate(table)
+        if reverse_complement:
+            # position x of the record is at 4 * last - 1 - x
+            offset = 4 * last - end
+            place = lambda a, b: (4 * last - b - offset, 4 * last - a - offset)
+        else:
+            offset = start - 4 * first
+            place = lambda a, b: (a - start, b - start)
+        bases = bases[offset:offset + end - start]
+        for a, b in _runs(record.n_starts, record.n_sizes, start, end):
+            a, b = place(a, b)
+            bases[a:b] = b"N" * (b - a)
+        for a, b in _runs(record.mask_starts, record.mask_sizes, start, end):
+            a, b = place(a, b)
+            bases[a:b] = bases[a:b].lower()
+        return bytes(bases)
+
+    def _fetch(self, record, start, end):
+        return self._fetch_bytes(record, start, end).decode()
+
+    def fetch_bytes(self, seqid, start=None, end=None, strand="+"):
+        """like fetch, but returns bytes"""
+        if strand not in ("-", "+", "."):
             raise StrandOrientationException("strand in unknown orientation.")
+        record = self._record(seqid)
+        start = 0 if start is None else int(start) - 1
+        end = record.length if end is None else int(end)
+        return self._fetch_bytes(record, start, end, reverse_complement=strand == "-")
 
-        return res
+    def fetch(self, seqid, start=None, end=None, strand="+"):
+        """
+        sequence of seqid between start and end (gff coordinates, starting at 1, end inclusive),
+        the reverse complement if strand is -
+        """
+        return self.fetch_bytes(seqid, start, end, strand).decode()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, seqid):
+        return IndexedSequence(self, self._record(seqid))
+
+    def __contains__(self, seqid):
+        return seqid in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+ORF = namedtuple("ORF", "start end strand frame protein")
 
 
 class SeqTranslator(object):
-    RNAmap = {
-        "UUU": "F", "UUC": "F", "UUA": "L", "UUG": "L",
-        "UCU": "S", "UCC": "S", "UCA": "S", "UCG": "S",
-        "UAU": "Y", "UAC": "Y", "UAA": "*", "UAG": "*",
-        "UGU": "C", "UGC": "C", "UGA": "*", "UGG": "W",
-        "CUU": "L", "CUC": "L", "CUA": "L", "CUG": "L",
-        "CCU": "P", "CCC": "P", "CCA": "P", "CCG": "P",
-        "CAU": "H", "CAC": "H", "CAA": "Q", "CAG": "Q",
-        "CGU": "R", "CGC": "R", "CGA": "R", "CGG": "R",
-        "AUU": "I", "AUC": "I", "AUA": "I", "AUG": "M",
-        "ACU": "T", "ACC": "T", "ACA": "T", "ACG": "T",
-        "AAU": "N", "AAC": "N", "AAA": "K", "AAG": "K",
-        "AGU": "S", "AGC": "S", "AGA": "R", "AGG": "R",
-        "GUU": "V", "GUC": "V", "GUA": "V", "GUG": "V",
-        "GCU": "A", "GCC": "A", "GCA": "A", "GCG": "A",
-        "GAU": "D", "GAC": "D", "GAA": "E", "GAG": "E",
-        "GGU": "G", "GGC": "G", "GGA": "G", "GGG": "G"
-    }
-    DNAmap = {
-        "TTT": "F", "TTC": "F", "TTA": "L", "TTG": "L",
-        "TCT": "S", "TCC": "S", "TCA": "S", "TCG": "S",
-        "TAT": "Y", "TAC": "Y", "TAA": "*", "TAG": "*",
-        "TGT": "C", "TGC": "C", "TGA": "*", "TGG": "W",
-        "CTT": "L", "CTC": "L", "CTA": "L", "CTG": "L",
-        "CCT": "P", "CCC": "P", "CCA": "P", "CCG": "P",
-        "CAT": "H", "CAC": "H", "CAA": "Q", "CAG": "Q",
-        "CGT": "R", "CGC": "R", "CGA": "R", "CGG": "R",
-        "ATT": "I", "ATC": "I", "ATA": "I", "ATG": "M",
-        "ACT": "T", "ACC": "T", "ACA": "T", "ACG": "T",
-        "AAT": "N", "AAC": "N", "AAA": "K", "AAG": "K",
-        "AGT": "S", "AGC": "S", "AGA": "R", "AGG": "R",
-        "GTT": "V", "GTC": "V", "GTA": "V", "GTG": "V",
-        "GCT": "A", "GCC": "A", "GCA": "A", "GCG": "A",
-        "GAT": "D", "GAC": "D", "GAA": "E", "GAG": "E",
-        "GGT": "G", "GGC": "G", "GGA": "G", "GGG": "G"
-    }
+    # the standard code (NCBI table 1), see geneticcode for the others
+    DNAmap = dict(gc.STANDARD.codons)
+    RNAmap = {codon.replace("T", "U"): aa for codon, aa in DNAmap.items()}
+
     @staticmethod
     def triplets(s, frameshift):
-        # chop string into 3 char slices
-        for i in range(0, int(len(s) / 3)): #todo debug
-            #print(s[i * 3 + frameshift:i * 3 + 3 + frameshift])
+        # chop string into 3 char slices, complete codons only
+        for i in range(0, (len(s) - frameshift) // 3):
             yield s[i * 3 + frameshift:i * 3 + 3 + frameshift]
 
     @staticmethod
-    def dna2prot(s, frameshift=0):
-        frameshift = int(frameshift)
-        res = ""
-        for a in SeqTranslator.triplets(s, frameshift):
-            try:
-                res += SeqTranslator.DNAmap[a]
-            except KeyError:
-                raise SequenceTranslationException("{} not in DNAmap, seq length:{}".format(a, len(s)))
+    def dna2prot(s, frameshift=0, table=1):
+        """
+        translate DNA or RNA s (str or bytes) starting at offset frameshift, an incomplete last codon is ignored.
+        table is a genetic code (see geneticcode.get_code), NCBI table number 1 (standard) by default.
+        codons with IUPAC ambiguity codes translate if all codons they stand for agree, otherwise they become X
+        """
+        return gc.get_code(table).translate(as_bytes(s)[int(frameshift):])
 
+    @staticmethod
+    def translate_many(seqs, frameshift=0, table=1):
+        """
+        translate a batch of sequences with a single pass of the translation engine,
+        frameshift is either one offset for all sequences or one per sequence. returns a list of proteins
+        """
+        if isinstance(frameshift, (int, str)):
+            frameshift = [int(frameshift)] * len(seqs)
+        trimmed = []
+        for s, f in zip(seqs, frameshift):
+            s = as_bytes(s)[int(f):]
+            trimmed.append(s[:len(s) // 3 * 3])
+        prot = gc.get_code(table).translate(b"".join(trimmed))
+        res = []
+        pos = 0
+        for s in trimmed:
+            res.append(prot[pos:pos + len(s) // 3])
+            pos += len(s) // 3
         return res
 
     @staticmethod
-    def rna2prot(s, frameshift=0):
-        frameshift = int(frameshift)
-        res = ""
-        for a in SeqTranslator.triplets(s, frameshift):
-            try:
-                res += SeqTranslator.RNAmap[a]
-            except KeyError as e:
-                print(e)
-                raise Exception("{} not in RNAmap".format(a))
-        return res
+    def translate_six_frames(s, table=1):
+        """
+        proteins of the six reading frames of s, in the order +1, +2, +3, -1, -2, -3
+        (frames of the reverse complement start at its first, second and third base)
+        """
+        code = gc.get_code(table)
+        fw = as_bytes(s)
+        rc = FastaHelper.reverse_complement(fw)
+        return [code.translate(x[f:]) for x in (fw, rc) for f in range(3)]
+
+    @staticmethod
+    def find_orfs(s, min_len=75, start_codons=("ATG",), table=1, chunk_size=3 << 20):
+        """
+        yield the open reading frames of s on both strands as ORF(start, end, strand, frame, protein):
+        start codon to stop codon (included in start..end, gff coordinates, not in protein),
+        at least min_len nucleotides long, using the first start codon after the previous stop.
+        table is a genetic code (see geneticcode.get_code), start_codons=None uses all its start codons,
+        proteins always begin with M
+        s can be a whole chromosome, e.g. an IndexedSequence of an IndexedFasta (read as bytes):
+        it is read and translated in chunks of chunk_size bases, stops and starts are located
+        with bytes.find on the translated chunks. ORFs come by strand (+ first), in order of their stop codons
+        """
+        length = len(s)
+        chunk_size = max(3, chunk_size // 3 * 3)
+        code = gc.get_code(table)
+        if start_codons is None:
+            start_table = code.start_table
+        else:
+            start_table = bytearray(b"-") * 256
+            for c in start_codons:
+                start_table[codon_index(c)] = ord("M")
+            start_table = bytes(start_table)
+
+        if isinstance(s, IndexedSequence):
+            read = s.get_bytes
+        else:
+            read = lambda a, b: as_bytes(s[a:b])
+
+        def minus(a, b):
+            return FastaHelper.reverse_complement(read(length - b, length - a))
+
+        for strand, fetch in (("+", read), ("-", minus)):
+            for orf in SeqTranslator._strand_orfs(fetch, length, min_len, code, start_table, chunk_size):
+                a, b, frame, protein = orf
+                if strand == "+":
+                    yield ORF(a + 1, b + 1, strand, frame, protein)
+                else:
+                    yield ORF(length - b, length - a, strand, frame, protein)
+
+    @staticmethod
+    def _strand_orfs(fetch, length, min_len, code, start_table, chunk_size):
+        """(first base, last base (0-based, strand coordinates), frame, protein) of the ORFs of one strand"""
+        # per frame: codon number of the pending start codon, protein pieces since then
+        pending = [[None, []] for _ in range(3)]
+        for o in range(0, length, chunk_size):
+            buf = as_bytes(fetch(o, min(o + chunk_size + 2, length)))
+            base = o // 3  # number of the first codon of this chunk, in every frame
+            for frame in range(3):
+                piece = buf[frame:frame + chunk_size]
+                idx = codon_indices(piece)
+                prot = code.translate_indices(piece, idx)
+                starts = idx.translate(start_table)
+                state = pending[frame]
+                pos = 0
+                while True:
+                    stop = prot.find(b"*", pos)
+                    end = stop if stop >= 0 else len(prot)
+                    if state[0] is None:
+                        m = starts.find(b"M", pos, end)
+                        if m >= 0:
+                            state[0] = base + m
+                            state[1] = [b"M", prot[m + 1:end]]  # alternative start codons code for M too
+                    else:
+                        state[1].append(prot[pos:end])
+                    if stop < 0:
+                        break
+                    if state[0] is not None:
+                        first = 3 * state[0] + frame
+                        last = 3 * (base + stop) + frame + 2
+                        if last - first + 1 >= min_len:
+                            yield first, last, frame, b"".join(state[1]).decode()
+                        state[0] = None
+                        state[1] = []
+                    pos = stop + 1
+
+    @staticmethod
+    def rna2prot(s, frameshift=0, table=1):
+        """same as dna2prot, U and T are read alike"""
+        return SeqTranslator.dna2prot(s, frameshift, table)
 
 
 class SequenceTranslationException(Exception):
     pass
 
 class StrandOrientationException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class FastaIndexException(Exception):
+    pass
@@ -0,0 +1,108 @@
+"""
+gene -> transcript -> exon/CDS/UTR hierarchy of a gff file, built in one pass.
+
+Features are looked up by ID and by Parent through dictionaries, so navigating
+the hierarchy doesn't need to scan the feature lists. Features with several Parents
+are children of each of them; discontinuous features, whose parts share one ID
+(e.g. the CDS lines of one protein), are kept together under that ID.
+"""
+from __future__ import print_function # python 2
+from collections import OrderedDict
+
+
+def feature_id(feature):
+    """ID of a GFFObject or GFFRecord, None if it has none"""
+    try:
+        return feature.get_ID()
+    except TypeError:  # no ID
+        return None
+
+
+class FeatureGraph(object):
+    def __init__(self, features):
+        """features: GFFObjects or GFFRecords, in file order"""
+        self._by_id = OrderedDict()
+        self._children = {}
+        self._roots = []
+        for f in features:
+            fid = feature_id(f)
+            if fid is not None:
+                self._by_id.setdefault(fid, []).append(f)
+            parents = f.get_Parent()
+            if parents:
+                for p in parents:
+                    self._children.setdefault(p, []).append(f)
+            else:
+                self._roots.append(f)
+
+    @classmethod
+    def from_gff_file(cls, gff):
+        return cls(gff.get_gff_objects())
+
+    def __contains__(self, fid):
+        return fid in self._by_id
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def ids(self, type=None):
+        """IDs of all features (of the given type), in file order"""
+        if type is None:
+            return list(self._by_id)
+        return [fid for fid, parts in self._by_id.items() if parts[0].type == type]
+
+    def features(self, fid):
+        """all parts of the feature with ID fid, a single one for continuous features"""
+        return list(self._by_id.get(fid, []))
+
+    def feature(self, fid):
+        """the (first part of the) feature with ID fid, None if there is none"""
+        parts = self._by_id.get(fid)
+        return parts[0] if parts else None
+
+    def children(self, fid, type=None):
+        """features whose Parent is fid, optionally only those of the given type, in file order"""
+        children = self._children.get(fid, [])
+        if type is None:
+            return list(children)
+        return [c for c in children if c.type == type]
+
+    def parent(self, fid):
+        """parent features of fid, one per Parent ID (several for features with multiple Parents)"""
+        parts = self._by_id.get(fid)
+        if not parts:
+            return []
+        res = []
+        for p in parts[0].get_Parent() or []:
+            parent = self.feature(p)
+            if parent is not None:
+                res.append(parent)
+        return res
+
+    def descendants(self, fid, type=None):
+        """
+        all features below fid (children, their children...), depth first,
+        each feature once even when it is reachable through several Parents
+        """
+        res = []
+        seen = set()
+        expanded = {fid}
+        stack = list(reversed(self._children.get(fid, [])))
+        while stack:
+            c = stack.pop()
+            if id(c) in seen:
+                continue
+            seen.add(id(c))
+            if type is None or c.type == type:
+                res.append(c)
+            cid = feature_id(c)
+            if cid is not None and cid not in expanded:
+                expanded.add(cid)
+                stack.extend(reversed(self._children.get(cid, [])))
+        return res
+
+    def roots(self, type=None):
+        """features without Parent"""
+        if type is None:
+            return list(self._roots)
+        return [r for r in self._roots if r.type == type]
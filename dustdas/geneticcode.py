@@ -0,0 +1,194 @@
+"""
+NCBI genetic codes (translation tables) and the translation engine using them.
+
+Codons are numbered 0..63 by their bases in TCAG order, two bits per base (TTT = 0, TTC = 1, ..., GGG = 63),
+which is also the order of the amino acid strings NCBI publishes for every table.
+A sequence is turned into codon numbers with three bytes.translate calls (one per codon position)
+that are combined with integer arithmetic, and the numbers are turned into amino acids
+with one more bytes.translate, so translating never loops over codons in python.
+Codons with bases other than ACGTU get a number >= 64; those holding IUPAC ambiguity codes
+are resolved to an amino acid if all codons they stand for agree (GCN is A), otherwise they become X.
+"""
+from __future__ import print_function # python 2
+import re
+from collections import OrderedDict
+from itertools import product
+
+CODON_BASES = "TCAG"
+_AMBIGUOUS = 64
+IUPAC_BASES = {
+    "A": "A", "C": "C", "G": "G", "T": "T", "U": "T",
+    "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+    "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT",
+}
+
+
+def _codon_position_table(shift):
+    t = bytearray([_AMBIGUOUS]) * 256
+    for i, b in enumerate(CODON_BASES + "U"):
+        code = (i if b != "U" else 0) << shift
+        t[ord(b)] = t[ord(b.lower())] = code
+    return bytes(t)
+
+
+_CODON_POSITION_TABLES = (_codon_position_table(4), _codon_position_table(2), _codon_position_table(0))
+CODONS = ["".join(c) for c in product(CODON_BASES, repeat=3)]
+
+
+def codon_index(codon):
+    """index 0..63 of a three letter codon, TCAG order"""
+    return sum(CODON_BASES.index(b) << (4 - 2 * i) for i, b in enumerate(codon.upper().replace("U", "T")))
+
+
+def as_bytes(s):
+    """s (str, bytes, bytearray or memoryview) as bytes, characters that aren't ascii become ?"""
+    if isinstance(s, str):
+        return s.encode("ascii", "replace")
+    return bytes(s)
+
+
+def codon_indices(s):
+    """
+    bytes with the codon index of every complete codon of DNA/RNA sequence s (str or bytes),
+    an index >= 64 for codons with other characters than ACGTU
+    """
+    s = as_bytes(s)
+    n = len(s) // 3
+    if n == 0:
+        return b""
+    first, second, third = _CODON_POSITION_TABLES
+    idx = (int.from_bytes(s[0:3 * n:3].translate(first), "big")
+           | int.from_bytes(s[1:3 * n:3].translate(second), "big")
+           | int.from_bytes(s[2:3 * n:3].translate(third), "big"))
+    return idx.to_bytes(n, "big")
+
+
+class GeneticCode(object):
+    """
+    one translation table: amino_acids and starts are 64 letter strings in TCAG codon order,
+    as NCBI lists them, starts has an M at every codon that can start translation
+    """
+    def __init__(self, id, name, amino_acids, starts):
+        if len(amino_acids) != 64 or len(starts) != 64:
+            raise GeneticCodeException("amino acids and starts need 64 letters each ({})".format(name))
+        self.id = id
+        self.name = name
+        self.amino_acids = amino_acids
+        self.starts = starts
+        self.codons = OrderedDict(zip(CODONS, amino_acids))
+        self.start_codons = tuple(c for c, s in zip(CODONS, starts) if s == "M")
+        self.stop_codons = tuple(c for c, aa in self.codons.items() if aa == "*")
+        # bytes.translate tables from codon index to amino acid / to M for start codons
+        self.table = (amino_acids + "X" * 192).encode()
+        self.start_table = "".join("M" if s == "M" else "-" for s in starts).encode() + b"-" * 192
+        self._resolved = {}
+
+    @classmethod
+    def from_codons(cls, codonmap, name="custom", start_codons=("ATG",)):
+        """code from a codon: amino acid dict (DNA or RNA codons), missing codons translate to X"""
+        aas = dict((c.upper().replace("U", "T"), aa) for c, aa in codonmap.items())
+        starts = {c.upper().replace("U", "T") for c in start_codons}
+        return cls(None, name, "".join(aas.get(c, "X") for c in CODONS),
+                   "".join("M" if c in starts else "-" for c in CODONS))
+
+    def __repr__(self):
+        return "GeneticCode({}, {!r})".format(self.id, self.name)
+
+    def resolve(self, codon):
+        """amino acid of a single codon (str or bytes), which may hold IUPAC ambiguity codes"""
+        codon = as_bytes(codon).decode().upper()
+        aa = self._resolved.get(codon)
+        if aa is None:
+            try:
+                choices = {self.codons["".join(c)] for c in product(*(IUPAC_BASES[b] for b in codon))}
+            except KeyError:  # not a base
+                choices = ()
+            aa = self._resolved[codon] = choices.pop() if len(codon) == 3 and len(choices) == 1 else "X"
+        return aa
+
+    def translate(self, s):
+        """protein (str) of the complete codons of s (str or bytes)"""
+        s = as_bytes(s)
+        return self.translate_indices(s, codon_indices(s)).decode()
+
+    def translate_indices(self, s, idx):
+        """amino acids (bytes) for codon_indices idx of s"""
+        prot = idx.translate(self.table)
+        if b"X" not in prot:
+            return prot
+        # codons with ambiguous bases, stretches of N stay X
+        prot = bytearray(prot)
+        for m in re.finditer(b"X+", prot):
+            a, b = m.span()
+            if not s[3 * a:3 * b].translate(None, b"Nn"):
+                continue
+            for i in range(a, b):
+                prot[i] = ord(self.resolve(s[3 * i:3 * i + 3]))
+        return bytes(prot)
+
+
+# NCBI translation tables, https://www.ncbi.nlm.nih.gov/Taxonomy/Utils/wprintgc.cgi
+CODES = OrderedDict((c.id, c) for c in [
+    GeneticCode(1, "Standard",
+                "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "---M------**--*----M---------------M----------------------------"),
+    GeneticCode(2, "Vertebrate Mitochondrial",
+                "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG",
+                "----------**--------------------MMMM----------**---M------------"),
+    GeneticCode(3, "Yeast Mitochondrial",
+                "FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "----------**----------------------MM---------------M------------"),
+    GeneticCode(4, "Mold, Protozoan, and Coelenterate Mitochondrial; Mycoplasma; Spiroplasma",
+                "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "--MM------**-------M------------MMMM---------------M------------"),
+    GeneticCode(5, "Invertebrate Mitochondrial",
+                "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG",
+                "---M------**--------------------MMMM---------------M------------"),
+    GeneticCode(6, "Ciliate, Dasycladacean and Hexamita Nuclear",
+                "FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "--------------*--------------------M----------------------------"),
+    GeneticCode(9, "Echinoderm and Flatworm Mitochondrial",
+                "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG",
+                "-----------------------------------M---------------M------------"),
+    GeneticCode(10, "Euplotid Nuclear",
+                "FFLLSSSSYY**CCCWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "-----------------------------------M----------------------------"),
+    GeneticCode(11, "Bacterial, Archaeal and Plant Plastid",
+                "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "---M------**--*----M------------MMMM---------------M------------"),
+    GeneticCode(12, "Alternative Yeast Nuclear",
+                "FFLLSSSSYY**CC*WLLLSPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+                "-------------------M---------------M----------------------------"),
+    GeneticCode(13, "Ascidian Mitochondrial",
+                "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSGGVVVVAAAADDEEGGGG",
+                "---M------------------------------MM---------------M------------"),
+])
+STANDARD = CODES[1]
+
+
+def get_code(table=1):
+    """
+    GeneticCode for table: an NCBI table number (int or str), a table name,
+    a GeneticCode or a codon: amino acid dict
+    """
+    if isinstance(table, GeneticCode):
+        return table
+    if isinstance(table, dict):
+        return GeneticCode.from_codons(table)
+    try:
+        return CODES[int(table)]
+    except (KeyError, ValueError, TypeError):
+        pass
+    for code in CODES.values():
+        if code.name == table:
+            return code
+    raise GeneticCodeException("unknown genetic code {!r}".format(table))
+
+
+def register(code):
+    """make GeneticCode code available to get_code by its id and name"""
+    CODES[code.id] = code
+
+
+class GeneticCodeException(Exception):
+    pass
@@ -2,94 +2,27 @@
 from __future__ import print_function # python 2
 import re
 import sys
+import copy
 import json
+import math
+import warnings
+from functools import cached_property
 import dustdas.fastahelper as fh
+from dustdas import bgzf, tabix
+from dustdas.census import GFFCensus
+from dustdas import gfftokenizer as gt
 
 
-class GFFObject(object):
-    @staticmethod
-    def parse_gffline(gffline):
-        """takes one line of a gff3 file and returns a dictionary"""
-        if gffline.startswith("#"):
-            pass
-        else:
-            gffcols = [g.strip() for g in gffline.split("\t")]
-
-            res = {"seqid": gffcols[0],
-                   "source": gffcols[1],
-                   "type": gffcols[2],
-                   "start": gffcols[3],
-                   "end": gffcols[4],
-                   "score": gffcols[5],
-                   "strand": gffcols[6],
-                   "phase": gffcols[7],
-                   "attribute": gffcols[8],
-                   }
+def _parse_attributes(attribute):
+    return [GFFAttribute(x.strip()) for x in attribute.split(";")]
 
-            return res
 
-    def __init__(self, gffline):
-        d = GFFObject.parse_gffline(gffline)
-        self.seqid = d["seqid"]
-        self.source = d["source"]
-        self.type = d["type"]
-        self.start = d["start"]
-        self.end = d["end"]
-        self.score = self.parse_score(d) #d["score"]
-        self.strand = d["strand"]
-        self.phase = d["phase"]
-        self.attribute = d["attribute"]
-        self.attributes = [GFFAttribute(x.strip()) for x in  d["attribute"].split(";")]
-        self.fasta_header = None
-        self.fasta_sequence = None
-    def parse_score(self, d):
-        try:
-            return float(d["score"])
-        except ValueError:
-            if d["score"] == ".":
-                return "."
-            else:
-                raise ValueError
-    def to_json(self, omit_fasta=False):
-        if omit_fasta:
-            res = dict()
-            for k, v in self.__dict__.items():
-                if k in ["fasta_header", "fasta_sequence"]:
-                    pass
-                else:
-                    res[k] = v
-            return json.dumps(res, default=lambda o: o.__dict__, sort_keys=True, indent=4)
-
-        return json.dumps(self, default=lambda o: o.__dict__,
-                          sort_keys=True, indent=4)
+GFF_COLUMNS = ("seqid", "source", "type", "start", "end", "score", "strand", "phase", "attribute")
 
-    def get_sequence(self, fastafile=None, fastadct=None, regex=None):
-        """ Takes either a path to a fasta file or a pre-filled dictionary with header and sequence as items.
-         If regex is present, it returns first header and sequence whose header matches that regex.
-         If no regex is set it returns the header and sequence whose header matches self.seqname exactly.
-        """
-        if fastafile:
-            for header, seq in fh.FastaParser.read_fasta(fasta=fastafile):
-                if regex:
-                    p = re.compile(regex)
-                    m = p.match(header)
-                    if m:
-                        return header, seq
-                else:
-                    if header == self.seqid:
-                        return header, seq
-        elif fastadct:
-            if regex:
-                p = re.compile(regex)
-                #print("debug", regex)
-            for header, seq in fastadct.items():
-                if regex:
 
-                    m = p.match(header)
-                    if m:
-                        return header, seq
-                else:
-                    return header, fastadct[header]
+class GFFAttributeAccess(object):
+    """filters and short cuts on the attributes (column 9), shared by GFFObject and GFFRecord"""
+    __slots__ = ()
 
     def attrib_filter_fun(self, tfun, targ, vfun, varg):
         """ Filters tags and values by given functions. First argument will always be mapped to attribute.tag (value),
@@ -120,15 +53,15 @@ class GFFObject(object):
         else:
             print("needs tag or value to filter. returns list of matches", file=sys.stderr)
 
-    def __repr__(self):
-        return "{},{},{},{},{},{},{},{},{}".format(self.seqid, self.source, self.type, self.start, self.end, self.score, self.strand, self.phase, self.attributes)
-
-    def attach_fasta(self, header, seq):
-        self.fasta_header = header
-        self.fasta_sequence = seq
+    def _attributes_parsed(self):
+        return True
 
     # short cuts
     def _get_attrib(self, attrib):
+        if not self._attributes_parsed():
+            # fast path: look the tag up in column 9 without building the attribute list
+            return gt.find_attribute(self.attribute, attrib)
+
         def fun():
             try:
                 res = self.attrib_filter(tag=attrib)[0].value
@@ -196,21 +129,157 @@ class GFFObject(object):
         """return Is_circular"""
         return self._get_attrib("Is_circular")
 
+
+class GFFObject(GFFAttributeAccess):
+    @staticmethod
+    def parse_gffline(gffline):
+        """takes one line of a gff3 file and returns a dictionary"""
+        if gffline.startswith("#"):
+            pass
+        else:
+            return dict(zip(GFF_COLUMNS, gt.split_gffline(gffline)))
+
+    def __init__(self, gffline, typed=False):
+        """
+        with typed=False, all columns are kept as strings (score as float, or '.').
+        with typed=True, start and end are ints, phase an int or None and score a float (nan for '.')
+        """
+        (self.seqid, self.source, self.type, start, end, score,
+         self.strand, phase, self.attribute) = gt.split_gffline(gffline)
+        if typed:
+            self.start = int(start)
+            self.end = int(end)
+            self.score = gt.typed_score(score)
+            self.phase = gt.typed_phase(phase)
+        else:
+            self.start = start
+            self.end = end
+            self.score = "." if score == "." else float(score)
+            self.phase = phase
+        self.fasta_header = None
+        self.fasta_sequence = None
+
+    @cached_property
+    def attributes(self):
+        """column 9 parsed on first access, afterwards kept in the instance __dict__ like a plain attribute"""
+        return _parse_attributes(self.attribute)
+
+    def _attributes_parsed(self):
+        return "attributes" in self.__dict__
+
+    def parse_score(self, d):
+        """score of dict d (e.g. from to_dict) as float, '.' for a missing score (also nan of typed objects)"""
+        score = gt.typed_score(d["score"])  # raises ValueError for anything else
+        return "." if math.isnan(score) else score
+
+    def to_dict(self, omit_fasta=False):
+        """the object's fields as a dict, with parsed attributes"""
+        self.attributes  # make sure they are parsed
+        res = dict()
+        for k, v in self.__dict__.items():
+            if omit_fasta and k in ["fasta_header", "fasta_sequence"]:
+                pass
+            else:
+                res[k] = v
+        return res
+
+    def to_json(self, omit_fasta=False):
+        return json.dumps(_json_score(self.to_dict(omit_fasta=omit_fasta)), default=_json_default,
+                          sort_keys=True, indent=4)
+
+    def get_sequence(self, fastafile=None, fastadct=None, regex=None, lookup=None):
+        """ Takes either a path to a fasta file or a pre-filled dictionary with header and sequence as items.
+         fastadct can also be a fastahelper.IndexedFasta, in which case only the requested regions are read.
+         If regex is present, it returns first header and sequence whose header matches that regex.
+         If no regex is set it returns the header and sequence whose header matches self.seqname exactly.
+         lookup is a fastahelper.FastaLookup, which finds the header for self.seqid with a single dict lookup
+         (by default, headers are looked up by their first word) and remembers regex matches.
+         Build one (e.g. FastaLookup(fastafile)) and pass it when fetching many features.
+         Without regex, a fastafile is read through its .fai index (built and written next to it if missing),
+         so only the record of self.seqid is read; gzip compressed files that aren't bgzip compressed,
+         files that can't be indexed and regex searches scan the file. A fastadct with a regex is scanned.
+        """
+        if lookup is not None:
+            if regex:
+                return lookup.match(regex)
+            return lookup.get(self.seqid)
+        p = re.compile(regex) if regex else None
+        if fastafile:
+            if p is None:
+                found = _indexed_sequence(fastafile, self.seqid)
+                if found is not False:
+                    return found
+            for header, seq in fh.FastaParser.read_fasta(fasta=fastafile):
+                if p is not None:
+                    if p.match(header):
+                        return header, seq
+                elif header == self.seqid:
+                    return header, seq
+        elif fastadct:
+            if p is None:
+                if self.seqid in fastadct:
+                    return self.seqid, fastadct[self.seqid]
+                return None
+            for header, seq in fastadct.items():
+                if p.match(header):
+                    return header, seq
+
+    def __repr__(self):
+        return "{},{},{},{},{},{},{},{},{}".format(self.seqid, self.source, self.type, self.start, self.end, self.score, self.strand, self.phase, self.attributes)
+
+    def attach_fasta(self, header, seq):
+        self.fasta_header = header
+        self.fasta_sequence = seq
+
     def embed_into(self, other):
+        """
+        deprecated: adds self to other.__dict__[self.type].
+        use dustdas.featuregraph.FeatureGraph to navigate gene/transcript models instead
+        """
+        warnings.warn("GFFObject.embed_into is deprecated, use dustdas.featuregraph.FeatureGraph",
+                      DeprecationWarning, stacklevel=2)
         if not self.type in other.__dict__:
             other.__dict__[self.type] = [self] #??
         else:
             other.__dict__[self.type].append(self)
 
 
+def _indexed_sequence(fastafile, seqid):
+    """
+    (seqid, sequence) of the record of fastafile whose header is exactly seqid, None if there is none,
+    found through the .fai index. False if that doesn't work and the file has to be scanned
+    """
+    try:
+        fasta = fh.IndexedFasta(fastafile)
+    except (fh.FastaIndexException, IOError, OSError):
+        return False
+    with fasta:
+        if seqid not in fasta:
+            return None
+        if fasta.header(seqid) != seqid:
+            return False  # more words in the header, a later record might match exactly
+        return seqid, fasta.fetch(seqid)
+
+
+def _json_score(d):
+    """d with a nan score (typed '.') written as '.', like untyped objects have it: NaN isn't valid json"""
+    score = d.get("score")
+    if isinstance(score, float) and math.isnan(score):
+        d["score"] = "."
+    return d
+
+
+def _json_default(o):
+    if isinstance(o, GFFObject):
+        return _json_score(o.to_dict())
+    return o.__dict__
+
+
 class GFFAttribute(object):
     def __init__(self, attribute_str):
-        p = re.compile(r"""(.*)=(.*)""")
-        m = p.match(attribute_str)
-        if m:
-           # r = [{"tag": m.groups()[0], "value": m.groups()[1]}]
-            self.tag = m.groups()[0]
-            self.value = [x for x in m.groups()[1].split(",")]
+        pair = gt.split_attribute(attribute_str)
+        if pair:
+            self.tag, self.value = pair
         else:
             self.tag = "wat"
             self.value = "wat"
@@ -219,10 +288,50 @@ class GFFAttribute(object):
         return "<tag:{},value:{}>".format(self.tag, self.value)
 
 
+class GFFRecord(GFFAttributeAccess):
+    """
+    compact gff feature without per-instance __dict__.
+    columns are typed: start and end are ints, score a float (nan for '.'), phase an int or None.
+    the attributes are parsed from column 9 on first access only
+    """
+    __slots__ = ("seqid", "source", "type", "start", "end", "score", "strand", "phase", "attribute", "_attributes")
+
+    def __init__(self, seqid, source, type, start, end, score=float("nan"), strand=".", phase=None, attribute=""):
+        self.seqid = seqid
+        self.source = source
+        self.type = type
+        self.start = start
+        self.end = end
+        self.score = score
+        self.strand = strand
+        self.phase = phase
+        self.attribute = attribute
+        self._attributes = None
+
+    @classmethod
+    def from_gffline(cls, gffline):
+        c = gt.split_gffline(gffline)
+        return cls(c[0], c[1], c[2], int(c[3]), int(c[4]), gt.typed_score(c[5]), c[6], gt.typed_phase(c[7]), c[8])
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = _parse_attributes(self.attribute)
+        return self._attributes
+
+    def _attributes_parsed(self):
+        return self._attributes is not None
+
+    def __repr__(self):
+        return "{},{},{},{},{},{},{},{},{}".format(self.seqid, self.source, self.type, self.start, self.end, self.score, self.strand, self.phase, self.attributes)
+
+
 class GFFFile(object):
 
     @property
     def metadata(self):
+        if self._metadata is None:
+            self._read_metadata()
         return self._metadata
 
     @property
@@ -231,11 +340,27 @@ class GFFFile(object):
 
     @metadata.setter
     def metadata(self, str): #append, not overwrite
-        self._metadata.append(str.strip().replace("##",""))
+        self.metadata.append(str.strip().replace("##",""))
 
-    def __init__(self, path):
-        self._metadata = []
+    @property
+    def typed(self):
+        return self._typed
+
+    def __init__(self, path, typed=False, cache=False):
+        """
+        typed is passed on to the GFFObjects created, see GFFObject.
+        with cache=True, the feature lines are kept in memory after the first pass over the file,
+        so later iterations neither read nor decompress it again
+        """
+        self._metadata = None
         self._path = path
+        self._typed = typed
+        self._cache = cache
+        self._lines = None
+
+    def _read_metadata(self):
+        """collect the ## directives of the header, stopping at the first feature line"""
+        self._metadata = []
         with fh.text_or_gzip_open(self._path, 'r') as f:
             for l in f:
                 if l.strip() == "":
@@ -244,17 +369,18 @@ class GFFFile(object):
                     self.metadata = l # todo confusing
                 elif l.startswith("#"):
                     pass
+                else:
+                    break
 
-    def get_available_types(self):
-        avail = {}
-        for o in self.get_gff_objects():
-            if o.type in avail:
-                avail[o.type] += 1
-            else:
-                avail[o.type] = 1
-        return avail
+    def _feature_lines(self):
+        if self._lines is not None:
+            return iter(self._lines)
+        if self._cache:
+            self._lines = list(self._read_feature_lines())
+            return iter(self._lines)
+        return self._read_feature_lines()
 
-    def get_gff_objects(self):
+    def _read_feature_lines(self):
         with fh.text_or_gzip_open(self._path, 'r') as f:
             for l in f:
                 if l.strip() == "":
@@ -262,11 +388,178 @@ class GFFFile(object):
                 elif l.startswith("#"):
                     pass
                 else:
-                    obj = GFFObject(gffline=l.strip())
-                    yield obj
+                    yield l.strip()
+
+    def census(self, parallel=None, sidecar=False):
+        """
+        GFFCensus (feature counts per type, seqid and source) from a fast pass over the file, see census.
+        parallel=N counts with N processes, sidecar=True keeps the result next to the file for the next time
+        """
+        if self._lines is not None:
+            return GFFCensus.from_lines(self._lines)
+        if sidecar:
+            return GFFCensus.for_gff(self._path, parallel=parallel)
+        return GFFCensus.count(self._path, parallel=parallel)
+
+    def get_available_types(self, parallel=None, sidecar=False):
+        """type: number of features"""
+        return self.census(parallel=parallel, sidecar=sidecar).types
+
+    def get_gff_objects(self):
+        for l in self._feature_lines():
+            obj = GFFObject(gffline=l, typed=self._typed)
+            yield obj
+
+    def query(self):
+        """GFFQuery over all features, see GFFQuery"""
+        return GFFQuery(self)
+
+    def fetch(self, seqid, start, end):
+        """
+        yield objects on seqid overlapping start..end (gff coordinates, starting at 1, end inclusive)
+        for bgzip compressed, sorted files this uses the tabix index (path.tbi, built if missing),
+        only inflating the blocks that hold the region. other files, including bgzip compressed ones
+        that can't be indexed because they aren't sorted, are scanned completely
+        """
+        index = self._tabix_index
+        if index is not None:
+            with bgzf.BgzfReader(self._path) as reader:
+                for l in index.fetch(reader, seqid, start, end):
+                    yield GFFObject(gffline=l.decode().strip(), typed=self._typed)
+        else:
+            start, end = int(start), int(end)
+            for o in self.get_gff_objects():
+                if o.seqid == seqid and int(o.start) <= end and int(o.end) >= start:
+                    yield o
+
+    @cached_property
+    def _tabix_index(self):
+        """
+        TabixIndex of a bgzip compressed file, None for other files and files not sorted by seqid and start.
+        looked up (read, or built) once per GFFFile, later fetches and queries reuse it
+        """
+        if not bgzf.is_bgzf(self._path):
+            return None
+        try:
+            return tabix.TabixIndex.for_bgzf(self._path)
+        except tabix.TabixException:
+            return None
+
+
+class GFFQuery(object):
+    """
+    composable filter over the features of a GFFFile, e.g.
+        gff.query().seqid("Chr1").type("CDS").region(1e6, 2e6).attr("Parent", startswith="AT1G")
+    every method returns a new query, iterating yields the matching GFFObjects.
+    seqid, type, source, strand, region and attr are checked on the raw, tab split line,
+    only lines passing all of them become GFFObjects (and only then are checked by where).
+    column values are compared exactly, without surrounding whitespace. region queries on a single seqid
+    of a sorted, bgzip compressed file use its tabix index
+    """
+    def __init__(self, gff):
+        self._gff = gff
+        self._seqids = None
+        self._types = None
+        self._sources = None
+        self._strands = None
+        self._region = None
+        self._attrs = ()
+        self._predicates = ()
+
+    def _with(self, **changes):
+        q = copy.copy(self)
+        for k, v in changes.items():
+            setattr(q, "_" + k, v)
+        return q
+
+    def seqid(self, *seqids):
+        return self._with(seqids=frozenset(seqids))
+
+    def type(self, *types):
+        return self._with(types=frozenset(types))
+
+    def source(self, *sources):
+        return self._with(sources=frozenset(sources))
+
+    def strand(self, *strands):
+        return self._with(strands=frozenset(strands))
+
+    def region(self, start, end):
+        """features overlapping start..end (gff coordinates)"""
+        return self._with(region=(int(start), int(end)))
+
+    def attr(self, tag, value=None, startswith=None):
+        """
+        features with a value of tag equal to value, or starting with startswith.
+        with neither, features that have the tag at all
+        """
+        return self._with(attrs=self._attrs + ((tag, value, startswith),))
+
+    def where(self, fun):
+        """features for which fun(GFFObject) is true"""
+        return self._with(predicates=self._predicates + (fun,))
+
+    def _raw_lines(self):
+        index = None
+        if self._region is not None and self._seqids is not None and len(self._seqids) == 1:
+            index = self._gff._tabix_index  # None if the file isn't bgzip compressed and sorted
+        if index is not None:
+            seqid, = self._seqids
+            with bgzf.BgzfReader(self._gff.path) as reader:
+                for l in index.fetch(reader, seqid, *self._region):
+                    yield l.decode().strip()
+        else:
+            for l in self._gff._feature_lines():
+                yield l
+
+    def lines(self):
+        """the raw lines passing all filters except where"""
+        seqids, types, sources, strands = self._seqids, self._types, self._sources, self._strands
+        region, attrs = self._region, self._attrs
+        for l in self._raw_lines():
+            cols = l.split("\t")
+            if len(cols) < 9:
+                gt.split_gffline(l)  # raises
+            if seqids is not None and cols[0].strip() not in seqids:
+                continue
+            if types is not None and cols[2].strip() not in types:
+                continue
+            if sources is not None and cols[1].strip() not in sources:
+                continue
+            if strands is not None and cols[6].strip() not in strands:
+                continue
+            if region is not None and (int(cols[3]) > region[1] or int(cols[4]) < region[0]):
+                continue
+            if attrs and not all(self._match_attr(cols[8], *a) for a in attrs):
+                continue
+            yield l
+
+    @staticmethod
+    def _match_attr(col9, tag, value, startswith):
+        values = gt.find_attribute(col9, tag)
+        if values is None:
+            return False
+        if value is not None:
+            return value in values
+        if startswith is not None:
+            return any(v.startswith(startswith) for v in values)
+        return True
+
+    def __iter__(self):
+        typed = self._gff.typed
+        for l in self.lines():
+            obj = GFFObject(gffline=l, typed=typed)
+            if all(p(obj) for p in self._predicates):
+                yield obj
+
+    def count(self):
+        """number of matching features, without creating objects unless there are where filters"""
+        if self._predicates:
+            return sum(1 for _ in self)
+        return sum(1 for _ in self.lines())
 
 
-def read_gff_file(infile):
+def read_gff_file(infile, typed=False):
 
     with fh.text_or_gzip_open(infile, 'r') as f:
         for l in f:
@@ -275,7 +568,7 @@ def read_gff_file(infile):
             elif l.startswith("#"):
                 pass
             else:
-                obj = GFFObject(gffline=l)
+                obj = GFFObject(gffline=l, typed=typed)
                 yield obj
 
 
@@ -0,0 +1,209 @@
+"""
+columnar, compact in-memory representation of the features of a gff file.
+
+Instead of one GFFObject per line, every column is stored once for all features:
+seqid, source and type as small integer codes into a list of their distinct values,
+start and end as arrays of machine integers, score as an array of doubles (nan for '.'),
+strand and phase as one byte per feature and column 9 as its raw string.
+Counting and selecting features works on these columns directly,
+GFFRecord objects are only created for the rows that are asked for.
+
+Large files can be parsed by several processes (from_gff_file(parallel=N)): the file is cut into byte ranges
+at line starts (for bgzip compressed files at the first line start after a block boundary),
+every worker parses its range into a table and the tables are concatenated.
+"""
+from __future__ import print_function # python 2
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import dustdas.fastahelper as fh
+from dustdas import gffhelper as gh
+from dustdas import gfftokenizer as gt
+
+
+class Categories(object):
+    """string column with few distinct values: an array of codes plus the list of values"""
+    def __init__(self):
+        self.values = []
+        self.codes = array("l")
+        self._code_of = {}
+
+    def _code_for(self, value):
+        code = self._code_of.get(value)
+        if code is None:
+            code = self._code_of[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self._code_for(value))
+
+    def extend(self, other):
+        """append all rows of Categories other"""
+        recode = [self._code_for(v) for v in other.values]
+        self.codes.extend(array("l", map(recode.__getitem__, other.codes)))
+
+    def code(self, value):
+        """code of value, None if it does not occur"""
+        return self._code_of.get(value)
+
+    def counts(self):
+        """value: number of rows, in order of first occurrence"""
+        c = Counter(self.codes)
+        return {v: c[i] for i, v in enumerate(self.values) if c[i]}
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class GFFTable(object):
+    def __init__(self):
+        self.seqid = Categories()
+        self.source = Categories()
+        self.type = Categories()
+        self.start = array("q")
+        self.end = array("q")
+        self.score = array("d")
+        self.strand = bytearray()
+        self.phase = bytearray()
+        self.attribute = []
+
+    @classmethod
+    def from_gff_file(cls, gff, parallel=None, ordered=True):
+        """
+        table of all features of gff, a GFFFile or a path.
+        with parallel=N, N processes parse parts of the file (not for gzip or zip files that aren't bgzip compressed),
+        ordered=False appends their rows as soon as they are done instead of in file order
+        """
+        path = gff.path if isinstance(gff, gh.GFFFile) else gff
+        ranges = fh.line_ranges(path, parallel * 4) if parallel and parallel > 1 else None
+        if ranges is not None and len(ranges) > 1:
+            table = cls()
+            with ProcessPoolExecutor(max_workers=parallel) as executor:
+                futures = [executor.submit(_parse_range, path, start, end) for start, end in ranges]
+                for future in (futures if ordered else as_completed(futures)):
+                    table.extend(future.result())
+            return table
+        table = cls()
+        with fh.text_or_gzip_open(path, 'r') as f:
+            table.append_gfflines(f)
+        return table
+
+    @classmethod
+    def from_records(cls, records):
+        """table of GFFRecord (or typed GFFObject) features"""
+        table = cls()
+        for r in records:
+            table.append(r.seqid, r.source, r.type, r.start, r.end, r.score, r.strand, r.phase, r.attribute)
+        return table
+
+    def append_gfflines(self, lines):
+        """append all feature lines of lines, skipping comments and empty lines"""
+        for l in lines:
+            if l.strip() == "" or l.startswith("#"):
+                continue
+            self.append_gffline(l)
+
+    def append_gffline(self, gffline):
+        c = gt.split_gffline(gffline)
+        self.append(c[0], c[1], c[2], int(c[3]), int(c[4]), gt.typed_score(c[5]), c[6], gt.typed_phase(c[7]), c[8])
+
+    def append(self, seqid, source, type, start, end, score, strand, phase, attribute):
+        self.seqid.append(seqid)
+        self.source.append(source)
+        self.type.append(type)
+        self.start.append(start)
+        self.end.append(end)
+        self.score.append(score)
+        self.strand.append(ord(strand) if len(strand) == 1 else ord("."))
+        self.phase.append(ord(".") if phase is None else ord("0") + phase)
+        self.attribute.append(attribute)
+
+    def extend(self, other):
+        """append all rows of GFFTable other"""
+        self.seqid.extend(other.seqid)
+        self.source.extend(other.source)
+        self.type.extend(other.type)
+        self.start.extend(other.start)
+        self.end.extend(other.end)
+        self.score.extend(other.score)
+        self.strand += other.strand
+        self.phase += other.phase
+        self.attribute.extend(other.attribute)
+
+    def __len__(self):
+        return len(self.start)
+
+    def _values(self, i):
+        phase = self.phase[i]
+        return (self.seqid[i], self.source[i], self.type[i], self.start[i], self.end[i], self.score[i],
+                chr(self.strand[i]), None if phase == ord(".") else phase - ord("0"), self.attribute[i])
+
+    def record(self, i):
+        """GFFRecord of row i"""
+        return gh.GFFRecord(*self._values(i))
+
+    def __getitem__(self, i):
+        return self.record(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def records(self, rows):
+        """GFFRecords of the given row numbers"""
+        return [self.record(i) for i in rows]
+
+    def rows(self, seqid=None, type=None, source=None, strand=None, start=None, end=None):
+        """
+        numbers of the rows matching all given column values.
+        with start and/or end, only rows overlapping start..end (gff coordinates) are returned
+        """
+        rows = range(len(self))
+        for column, value in ((self.seqid, seqid), (self.type, type), (self.source, source)):
+            if value is not None:
+                code = column.code(value)
+                if code is None:
+                    return []
+                codes = column.codes
+                rows = [i for i in rows if codes[i] == code]
+        if strand is not None:
+            s = ord(strand)
+            rows = [i for i in rows if self.strand[i] == s]
+        if end is not None:
+            starts = self.start
+            rows = [i for i in rows if starts[i] <= end]
+        if start is not None:
+            ends = self.end
+            rows = [i for i in rows if ends[i] >= start]
+        return list(rows)
+
+    def take(self, rows):
+        """new table with the given rows"""
+        table = GFFTable()
+        for i in rows:
+            table.append(*self._values(i))
+        return table
+
+    def count_types(self):
+        """type: number of features, like GFFFile.get_available_types"""
+        return self.type.counts()
+
+    def count_seqids(self):
+        return self.seqid.counts()
+
+    def count_sources(self):
+        return self.source.counts()
+
+
+def _parse_range(path, start, end):
+    """GFFTable of the lines in [start, end) of path, run in worker processes"""
+    with fh.open_random_access(path) as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    table = GFFTable()
+    table.append_gfflines(data.decode().split("\n"))
+    return table
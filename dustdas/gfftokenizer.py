@@ -0,0 +1,82 @@
+"""
+tokenizing of gff3 feature lines.
+
+Lines are split on tabs once, column 9 is split with str.partition and values are
+percent-decoded as the gff3 specification requires (%3B ';', %3D '=', %26 '&', %2C ',', %09 tab, ...).
+Decoding is skipped entirely for the (usual) lines without any '%'.
+"""
+from __future__ import print_function # python 2
+try:
+    from urllib.parse import unquote
+except ImportError:  # python 2
+    from urllib import unquote
+
+
+def split_gffline(gffline):
+    """the nine columns of gffline with surrounding whitespace removed, further tab separated fields are dropped"""
+    cols = gffline.split("\t")
+    if len(cols) < 9:
+        raise GFFLineException("expected 9 tab separated columns, got {}: {}".format(len(cols), gffline.rstrip()))
+    return list(map(str.strip, cols[:9]))
+
+
+def typed_score(score):
+    """score column as float, nan for '.'"""
+    return float("nan") if score == "." else float(score)
+
+
+def typed_phase(phase):
+    """phase column as int, None for '.'"""
+    return None if phase == "." else int(phase)
+
+
+def split_attribute(attribute_str, decode=True):
+    """
+    tag and list of values of one tag=value[,value...] pair, percent-decoded
+    None if there is no '='
+    """
+    tag, sep, value = attribute_str.partition("=")
+    if not sep:
+        return None
+    if decode and "%" in attribute_str:
+        return unquote(tag), [unquote(v) for v in value.split(",")]
+    return tag, value.split(",")
+
+
+def parse_attributes(attribute):
+    """list of (tag, values) of column 9, pieces without '=' are skipped"""
+    decode = "%" in attribute
+    res = []
+    for a in attribute.split(";"):
+        pair = split_attribute(a.strip(), decode=decode)
+        if pair is not None:
+            res.append(pair)
+    return res
+
+
+def find_attribute(attribute, tag):
+    """values of the first tag in column 9 string attribute, None if it is not there"""
+    key = tag + "="
+    if attribute.startswith(key):
+        i = len(key)
+    else:
+        i = attribute.find(";" + key)
+        if i < 0:
+            if key not in attribute and "%" not in attribute:
+                return None
+            # whitespace around ';' or encoded tags
+            for a in attribute.split(";"):
+                pair = split_attribute(a.strip())
+                if pair is not None and pair[0] == tag:
+                    return pair[1]
+            return None
+        i += len(key) + 1
+    j = attribute.find(";", i)
+    value = (attribute[i:] if j < 0 else attribute[i:j]).strip()
+    if "%" in value:
+        return [unquote(v) for v in value.split(",")]
+    return value.split(",")
+
+
+class GFFLineException(ValueError):
+    pass
@@ -0,0 +1,165 @@
+"""
+region queries on the features of a gff file.
+
+Per seqid, features are sorted by start and stored in flat arrays that form an implicit,
+augmented binary search tree (the layout of cgranges by Heng Li): the node at index i
+additionally keeps the largest end in its subtree, so whole subtrees ending before a query can be skipped.
+Overlap queries take O(log n + k) for k hits, no tree objects are built.
+"""
+from __future__ import print_function # python 2
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class IntervalTree(object):
+    """
+    intervals [start, end) (0-based, half open) of one sequence, with one payload each
+    """
+    def __init__(self, intervals):
+        """intervals: iterable of (start, end, payload)"""
+        intervals = sorted(intervals, key=lambda x: (x[0], x[1]))
+        self.starts = array("q", [x[0] for x in intervals])
+        self.ends = array("q", [x[1] for x in intervals])
+        self.items = [x[2] for x in intervals]
+        self._max_end, self._max_level = self._index(self.starts, self.ends)
+        # for nearest(): interval numbers ordered by end
+        self._by_end = sorted(range(len(self.ends)), key=self.ends.__getitem__)
+        self._sorted_ends = array("q", [self.ends[i] for i in self._by_end])
+
+    @staticmethod
+    def _index(starts, ends):
+        n = len(starts)
+        max_end = array("q", ends)
+        if n == 0:
+            return max_end, -1
+        last_i = 0
+        last = 0
+        for i in range(0, n, 2):
+            last_i = i
+            last = max_end[i] = ends[i]
+        k = 1
+        while 1 << k <= n:
+            x = 1 << (k - 1)
+            for i in range((x << 1) - 1, n, x << 2):
+                left = max_end[i - x]
+                right = max_end[i + x] if i + x < n else last
+                max_end[i] = max(ends[i], left, right)
+            last_i = last_i - x if last_i >> k & 1 else last_i + x
+            if last_i < n and max_end[last_i] > last:
+                last = max_end[last_i]
+            k += 1
+        return max_end, k - 1
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        """sorted numbers of the intervals overlapping [start, end)"""
+        n = len(self.starts)
+        if n == 0:
+            return []
+        starts, ends, max_end = self.starts, self.ends, self._max_end
+        res = []
+        stack = [(self._max_level, (1 << self._max_level) - 1, False)]
+        while stack:
+            k, x, left_done = stack.pop()
+            if k <= 3:
+                # small subtree: scan it
+                i0 = x >> k << k
+                for i in range(i0, min(i0 + (1 << (k + 1)) - 1, n)):
+                    if starts[i] >= end:
+                        break
+                    if start < ends[i]:
+                        res.append(i)
+            elif not left_done:
+                stack.append((k, x, True))
+                y = x - (1 << (k - 1))
+                if y >= n or max_end[y] > start:
+                    stack.append((k - 1, y, False))
+            elif x < n and starts[x] < end:
+                if start < ends[x]:
+                    res.append(x)
+                stack.append((k - 1, x + (1 << (k - 1)), False))
+        res.sort()
+        return res
+
+    def nearest(self, start, end):
+        """
+        sorted numbers of the intervals overlapping [start, end), if there are any,
+        otherwise of the closest intervals on either side (all of them, if several are equally close)
+        """
+        hits = self.overlapping(start, end)
+        if hits or len(self.starts) == 0:
+            return hits
+        right = bisect_left(self.starts, end)
+        left = bisect_right(self._sorted_ends, start) - 1
+        d_right = self.starts[right] - end if right < len(self.starts) else None
+        d_left = start - self._sorted_ends[left] if left >= 0 else None
+        res = []
+        if d_right is not None and (d_left is None or d_right <= d_left):
+            i = right
+            while i < len(self.starts) and self.starts[i] == self.starts[right]:
+                res.append(i)
+                i += 1
+        if d_left is not None and (d_right is None or d_left <= d_right):
+            i = left
+            while i >= 0 and self._sorted_ends[i] == self._sorted_ends[left]:
+                res.append(self._by_end[i])
+                i -= 1
+        res.sort()
+        return res
+
+
+class GFFIntervalIndex(object):
+    """
+    one IntervalTree per seqid over gff features (GFFObject, GFFRecord, anything with seqid, start and end).
+    queries use gff coordinates (starting at 1, end inclusive) and return the features sorted by start
+    """
+    def __init__(self, features):
+        by_seqid = {}
+        for f in features:
+            by_seqid.setdefault(f.seqid, []).append((int(f.start) - 1, int(f.end), f))
+        self._trees = {seqid: IntervalTree(intervals) for seqid, intervals in by_seqid.items()}
+
+    @classmethod
+    def from_gff_file(cls, gff, types=None):
+        """index the features of GFFFile gff, optionally only those of the given types"""
+        features = gff.get_gff_objects()
+        if types is not None:
+            types = set(types)
+            features = (o for o in features if o.type in types)
+        return cls(features)
+
+    @property
+    def seqids(self):
+        return list(self._trees)
+
+    def __len__(self):
+        return sum(len(t) for t in self._trees.values())
+
+    def overlapping(self, seqid, start, end=None):
+        """features overlapping start..end; end defaults to start for point queries"""
+        tree = self._trees.get(seqid)
+        if tree is None:
+            return []
+        start = int(start)
+        end = start if end is None else int(end)
+        return [tree.items[i] for i in tree.overlapping(start - 1, end)]
+
+    def contained_in(self, seqid, start, end):
+        """features lying completely within start..end"""
+        tree = self._trees.get(seqid)
+        if tree is None:
+            return []
+        start, end = int(start), int(end)
+        return [tree.items[i] for i in tree.overlapping(start - 1, end)
+                if tree.starts[i] >= start - 1 and tree.ends[i] <= end]
+
+    def nearest(self, seqid, start, end=None):
+        """features overlapping start..end, or, if there are none, the closest ones up- or downstream"""
+        tree = self._trees.get(seqid)
+        if tree is None:
+            return []
+        start = int(start)
+        end = start if end is None else int(end)
+        return [tree.items[i] for i in tree.nearest(start - 1, end)]
@@ -0,0 +1,170 @@
+"""
+GC content, N fraction and soft-masked (lowercase) fraction of the features of a gff file, e.g. for QC.
+
+Every chromosome is read once and its cumulative GC, N and lowercase counts are kept at every step-th base
+(SequenceCounts), so the counts of any region are the difference of two checkpoints plus the bases
+of at most two partial steps, counted with bytes.translate. Features are taken from the raw gff lines
+and grouped by seqid, and a fasta file is streamed record by record, so a whole annotation
+takes a single pass over the genome.
+
+    python -m dustdas.regionstats annotation.gff3 genome.fa -t gene exon CDS > stats.tsv
+"""
+from __future__ import print_function # python 2
+import argparse
+import sys
+import warnings
+from array import array
+from collections import OrderedDict, namedtuple
+import dustdas.fastahelper as fh
+from dustdas import gffhelper as gh
+from dustdas import gfftokenizer as gt
+from dustdas.geneticcode import as_bytes
+
+GC_BASES = b"GCSgcs"
+N_BASES = b"Nn"
+MASKED_BASES = bytes(range(ord("a"), ord("z") + 1))
+
+
+def _count(seq, bases):
+    """number of bytes of seq that are in bases"""
+    return len(seq) - len(seq.translate(None, bases))
+
+
+class SequenceCounts(object):
+    """cumulative GC, N and soft-masked base counts of sequence seq (str or bytes) at every step-th position"""
+    def __init__(self, seq, step=1024):
+        self.seq = as_bytes(seq)
+        self.step = step
+        self.gc, self.n, self.masked = array("Q", [0]), array("Q", [0]), array("Q", [0])
+        gc = n = masked = 0
+        for i in range(step, len(self.seq) + 1, step):
+            block = self.seq[i - step:i]
+            gc += _count(block, GC_BASES)
+            n += _count(block, N_BASES)
+            masked += _count(block, MASKED_BASES)
+            self.gc.append(gc)
+            self.n.append(n)
+            self.masked.append(masked)
+
+    def __len__(self):
+        return len(self.seq)
+
+    def counts(self, start, end):
+        """(gc, n, masked) of the bases [start, end) (0-based, half open)"""
+        start = max(start, 0)
+        end = min(end, len(self.seq))
+        if start >= end:
+            return 0, 0, 0
+        a = -(-start // self.step)  # first checkpoint at or after start
+        b = end // self.step
+        if a >= b:
+            parts = [self.seq[start:end]]
+            a = b = 0
+        else:
+            parts = [self.seq[start:a * self.step], self.seq[b * self.step:end]]
+        return tuple(cumulative[b] - cumulative[a] + sum(_count(p, bases) for p in parts)
+                     for cumulative, bases in ((self.gc, GC_BASES), (self.n, N_BASES),
+                                               (self.masked, MASKED_BASES)))
+
+
+class RegionStats(namedtuple("RegionStats", "seqid start end strand type id gc n masked")):
+    """GC, N and soft-masked base counts of a feature, start and end in gff coordinates"""
+    __slots__ = ()
+
+    @property
+    def length(self):
+        return self.end - self.start + 1
+
+    @property
+    def gc_content(self):
+        """fraction of G and C among the bases that aren't N"""
+        called = self.length - self.n
+        return self.gc / float(called) if called > 0 else float("nan")
+
+    @property
+    def n_fraction(self):
+        return self.n / float(self.length) if self.length > 0 else float("nan")
+
+    @property
+    def masked_fraction(self):
+        return self.masked / float(self.length) if self.length > 0 else float("nan")
+
+
+def _chromosomes(fasta, seqids):
+    """(seqid, sequence as bytes or str) of the seqids found in fasta, a path or a seqid: sequence mapping"""
+    if isinstance(fasta, str):
+        for h, s in fh.FastaParser.read_fasta_blocks(fasta, binary=True):
+            words = h.split()
+            seqid = words[0].decode() if words else ""
+            if seqid in seqids:
+                yield seqid, s
+    else:
+        for seqid in list(seqids):
+            if seqid not in fasta:
+                continue
+            if hasattr(fasta, "fetch_bytes"):
+                # IndexedFasta, MmapFasta, PackedGenome: read as bytes, without a decoded copy
+                yield seqid, fasta.fetch_bytes(seqid)
+            else:
+                seq = fasta[seqid]
+                yield seqid, seq if isinstance(seq, (str, bytes, bytearray)) else str(seq)
+
+
+def region_stats(gff, fasta, types=None, step=1024):
+    """
+    RegionStats of the features of gff (GFFFile or path) of the given types (all if None), in file order.
+    fasta is a path, or a mapping seqid: sequence like a dict, IndexedFasta or PackedGenome.
+    features running past the end of their sequence are clipped to it, with a warning
+    """
+    if not isinstance(gff, gh.GFFFile):
+        gff = gh.GFFFile(gff)
+    query = gff.query()
+    if types:
+        query = query.type(*types)
+    regions = OrderedDict()
+    n = 0
+    for l in query.lines():
+        cols = l.split("\t")
+        ids = gt.find_attribute(cols[8], "ID")
+        regions.setdefault(cols[0].strip(), []).append(
+            (n, int(cols[3]), int(cols[4]), cols[6].strip(), cols[2].strip(), ids[0] if ids else None))
+        n += 1
+    stats = [None] * n
+    for seqid, seq in _chromosomes(fasta, regions):
+        counts = SequenceCounts(seq, step=step)
+        length = len(counts)
+        clipped = 0
+        for i, start, end, strand, type, id in regions.pop(seqid):
+            if end > length:
+                clipped += 1
+                end = max(length, start - 1)
+            stats[i] = RegionStats(seqid, start, end, strand, type, id, *counts.counts(start - 1, end))
+        if clipped:
+            warnings.warn("{} features run past the end of {} ({} bases), clipped".format(clipped, seqid, length))
+        if not regions:
+            break
+    for seqid, features in regions.items():
+        warnings.warn("{} is not in the fasta file, skipping {} features".format(seqid, len(features)))
+    return [s for s in stats if s is not None]
+
+
+def write_stats(stats, out):
+    """write RegionStats as tab separated lines to handle out"""
+    out.write("seqid\tstart\tend\tstrand\ttype\tid\tlength\tgc_content\tn_fraction\tmasked_fraction\n")
+    for s in stats:
+        out.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{:.4f}\t{:.4f}\t{:.4f}\n".format(
+            s.seqid, s.start, s.end, s.strand, s.type, s.id or ".", s.length,
+            s.gc_content, s.n_fraction, s.masked_fraction))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GC content, N and soft-masked fraction of the features of a gff file")
+    parser.add_argument("gff", type=str, help="path to gff file")
+    parser.add_argument("fasta", type=str, help="path to genome fasta file")
+    parser.add_argument("-t", "--types", nargs="*", help="feature types to report (default: all)")
+    args = parser.parse_args()
+    write_stats(region_stats(args.gff, args.fasta, types=args.types), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
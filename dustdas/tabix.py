@@ -0,0 +1,216 @@
+"""
+tabix (.tbi) indices for bgzip compressed, position sorted tab separated files such as gff3.
+
+The index stores, per sequence, the BGZF virtual offsets of the lines falling into each bin of the
+UCSC binning scheme, plus a linear index of the first line overlapping every 16 kb window.
+A region query then only inflates the few blocks holding candidate lines.
+Indices written here can be read by tabix and vice versa.
+"""
+from __future__ import print_function # python 2
+import struct
+from collections import OrderedDict
+from dustdas import bgzf
+
+TBI_MAGIC = b"TBI\x01"
+MIN_SHIFT = 14
+# bin htslib uses for per-reference metadata, not a real bin
+META_BIN = 37450
+# tabix presets: format, seq column, begin column, end column (1-based), meta character, lines to skip
+PRESET_GFF = (0, 1, 4, 5, "#", 0)
+
+
+def reg2bin(beg, end):
+    """smallest bin containing [beg, end), 0-based half open"""
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+def reg2bins(beg, end):
+    """all bins that may hold intervals overlapping [beg, end), 0-based half open"""
+    end -= 1
+    bins = [0]
+    for shift, offset in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+class TabixReference(object):
+    """bins (bin: list of [begin, end) virtual offset chunks) and linear index of one sequence"""
+    def __init__(self, bins=None, linear=None):
+        self.bins = bins if bins is not None else OrderedDict()
+        self.linear = linear if linear is not None else []
+
+
+class TabixIndex(object):
+    def __init__(self, names=None, references=None, preset=PRESET_GFF):
+        self.names = names or []
+        self.references = references or []
+        self.format, self.col_seq, self.col_beg, self.col_end, self.meta, self.skip = preset
+        self._ids = {n: i for i, n in enumerate(self.names)}
+
+    @staticmethod
+    def index_path(path):
+        return path + ".tbi"
+
+    @classmethod
+    def read(cls, tbi):
+        with bgzf.BgzfReader(tbi) as f:
+            data = f.read()
+        if data[:4] != TBI_MAGIC:
+            raise TabixException("{} is not a tabix index".format(tbi))
+        n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from("<8i", data, 4)
+        pos = 36
+        names = [n.decode() for n in data[pos:pos + l_nm].split(b"\x00")[:n_ref]]
+        pos += l_nm
+        references = []
+        for _ in range(n_ref):
+            ref = TabixReference()
+            n_bin, = struct.unpack_from("<i", data, pos)
+            pos += 4
+            for _ in range(n_bin):
+                b, n_chunk = struct.unpack_from("<Ii", data, pos)
+                pos += 8
+                chunks = struct.unpack_from("<{}Q".format(2 * n_chunk), data, pos)
+                pos += 16 * n_chunk
+                if b != META_BIN:
+                    ref.bins[b] = [[chunks[i], chunks[i + 1]] for i in range(0, len(chunks), 2)]
+            n_intv, = struct.unpack_from("<i", data, pos)
+            pos += 4
+            ref.linear = list(struct.unpack_from("<{}Q".format(n_intv), data, pos))
+            pos += 8 * n_intv
+            references.append(ref)
+        return cls(names, references, (fmt, col_seq, col_beg, col_end, chr(meta), skip))
+
+    @classmethod
+    def build(cls, path, preset=PRESET_GFF):
+        """index the bgzip compressed file path, which must be sorted by sequence and start"""
+        index = cls(preset=preset)
+        col_seq, col_beg, col_end = index.col_seq - 1, index.col_beg - 1, index.col_end - 1
+        meta = index.meta.encode()
+        ref = None
+        last_beg = -1
+        with bgzf.BgzfReader(path) as f:
+            voffset = f.tell_virtual()
+            for lineno, line in enumerate(f):
+                next_voffset = f.tell_virtual()
+                if lineno < index.skip or line.startswith(meta) or not line.strip():
+                    voffset = next_voffset
+                    continue
+                cols = line.rstrip(b"\r\n").split(b"\t")
+                seqid = cols[col_seq].strip().decode()
+                beg = int(cols[col_beg]) - 1
+                end = int(cols[col_end]) if col_end >= 0 else beg + 1
+                if ref is None or seqid != index.names[-1]:
+                    if seqid in index._ids:
+                        raise TabixException("{} is not grouped by sequence ({})".format(path, seqid))
+                    index._ids[seqid] = len(index.names)
+                    index.names.append(seqid)
+                    ref = TabixReference()
+                    index.references.append(ref)
+                    last_beg = -1
+                if beg < last_beg:
+                    raise TabixException("{} is not sorted by start ({}:{})".format(path, seqid, beg + 1))
+                last_beg = beg
+                end = max(end, beg + 1)
+                chunks = ref.bins.setdefault(reg2bin(beg, end), [])
+                if chunks and chunks[-1][1] == voffset:
+                    chunks[-1][1] = next_voffset
+                else:
+                    chunks.append([voffset, next_voffset])
+                last_window = (end - 1) >> MIN_SHIFT
+                if len(ref.linear) <= last_window:
+                    ref.linear.extend([None] * (last_window + 1 - len(ref.linear)))
+                for w in range(beg >> MIN_SHIFT, last_window + 1):
+                    if ref.linear[w] is None:
+                        ref.linear[w] = voffset
+                voffset = next_voffset
+        for ref in index.references:
+            # windows without features start where the previous window starts
+            prev = 0
+            for w, v in enumerate(ref.linear):
+                if v is None:
+                    ref.linear[w] = prev
+                else:
+                    prev = v
+        return index
+
+    @classmethod
+    def for_bgzf(cls, path, write=True):
+        """read path's .tbi if present and up to date, otherwise build it (and write it, if write is True)"""
+        return bgzf.read_or_build(path, cls.index_path(path), cls.read, lambda: cls.build(path), write=write)
+
+    def write(self, tbi):
+        names = b"".join(n.encode() + b"\x00" for n in self.names)
+        parts = [TBI_MAGIC, struct.pack("<8i", len(self.names), self.format, self.col_seq, self.col_beg,
+                                        self.col_end, ord(self.meta), self.skip, len(names)), names]
+        for ref in self.references:
+            parts.append(struct.pack("<i", len(ref.bins)))
+            for b, chunks in ref.bins.items():
+                parts.append(struct.pack("<Ii", b, len(chunks)))
+                parts.append(struct.pack("<{}Q".format(2 * len(chunks)), *[v for c in chunks for v in c]))
+            parts.append(struct.pack("<i", len(ref.linear)))
+            parts.append(struct.pack("<{}Q".format(len(ref.linear)), *ref.linear))
+        with bgzf.BgzfWriter(tbi) as out:
+            out.write(b"".join(parts))
+
+    def chunks(self, seqid, start, end):
+        """
+        merged [begin, end) virtual offset chunks that hold all lines of seqid possibly overlapping start..end
+        (gff coordinates, starting at 1, end inclusive)
+        """
+        if seqid not in self._ids:
+            return []
+        ref = self.references[self._ids[seqid]]
+        beg = max(int(start) - 1, 0)
+        end = max(int(end), beg + 1)
+        w = beg >> MIN_SHIFT
+        min_offset = ref.linear[w] if w < len(ref.linear) else (ref.linear[-1] if ref.linear else 0)
+        candidates = sorted(c for b in reg2bins(beg, end) for c in ref.bins.get(b, ()) if c[1] > min_offset)
+        merged = []
+        for c_beg, c_end in candidates:
+            c_beg = max(c_beg, min_offset)
+            if merged and c_beg <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], c_end)
+            else:
+                merged.append([c_beg, c_end])
+        return merged
+
+    def fetch(self, reader, seqid, start, end):
+        """
+        yield the raw lines (bytes) of seqid overlapping start..end (gff coordinates)
+        reader is a bgzf.BgzfReader of the indexed file
+        """
+        col_seq, col_beg, col_end = self.col_seq - 1, self.col_beg - 1, self.col_end - 1
+        meta = self.meta.encode()
+        start, end = int(start), int(end)
+        for c_beg, c_end in self.chunks(seqid, start, end):
+            reader.seek_virtual(c_beg)
+            while reader.tell_virtual() < c_end:
+                line = reader.readline()
+                if not line:
+                    break
+                if line.startswith(meta) or not line.strip():
+                    continue
+                cols = line.rstrip(b"\r\n").split(b"\t")
+                if cols[col_seq].strip().decode() != seqid:
+                    continue
+                l_beg = int(cols[col_beg])
+                if l_beg > end:
+                    break
+                l_end = int(cols[col_end]) if col_end >= 0 else l_beg
+                if l_end >= start:
+                    yield line
+
+
+class TabixException(Exception):
+    pass
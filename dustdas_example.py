@@ -6,6 +6,7 @@ import json
 
 from dustdas import gffhelper as gh
 from dustdas import fastahelper as fh
+from dustdas.featuregraph import FeatureGraph
 
 
 def format_help():
@@ -40,37 +41,17 @@ def main():
     parser.add_argument("fasta", type=str, help="path to genome fasta file")
     args = parser.parse_args()
     all_features = {}
-
-    genes = []
-    five_prime_utrs = []
-    three_prime_utrs = []
-    mrnas = []
-    exons = []
-    cds = []
+    features = []
 
     for o in gh.read_gff_file(infile=args.gff):
         if o.type in all_features:
             all_features[o.type] += 1
         else:
             all_features[o.type] = 1
+        features.append(o)
 
-        if o.type == "mRNA":
-            mrnas.append(o)
-
-        if o.type == "gene":
-            genes.append(o)
-
-        if o.type == "CDS":
-            cds.append(o)
-
-        if o.type == "exon":
-            exons.append(o)
-
-        if o.type == "five_prime_UTR":
-            five_prime_utrs.append(o)
-
-        if o.type == "three_prime_UTR":
-            three_prime_utrs.append(o)
+    graph = FeatureGraph(features)
+    genes = graph.roots(type="gene")
 
     print(all_features)
 
@@ -80,17 +61,15 @@ def main():
     #    print("mRNA:")
     #    print (g)
 
-    fasta_dict = fh.FastaParser.read_fasta_whole(args.fasta)
+    # sequences by the first word of their header, i.e. the seqid
+    fasta_lookup = fh.FastaLookup(fh.FastaParser.read_fasta_whole(args.fasta))
 
-    def setupseq(gffobj, fastadct, regex):
+    def setupseq(gffobj, lookup):
         """
-        :param fastadct: dict
-        :param regex: rawstring for regex
+        :param lookup: fastahelper.FastaLookup
         :type gffobj: GFFObject
         """
-        ident = gffobj.seqid
-        r = regex.format(ident) # eg "^{} .*"
-        h, s = gffobj.get_sequence(fastadct=fastadct, regex=r)
+        h, s = gffobj.get_sequence(lookup=lookup)
         seq = fh.FastaParser.get_sequence_by_coordinates(orig_seq=s,
                                                          start=gffobj.start,
                                                          end=gffobj.end,
@@ -108,18 +87,18 @@ def main():
     #example:
     for g in genes[0:2]:
         with open ("{}.json".format(g.get_ID()),'w') as out:
-            for m in [x for x in mrnas if g.get_ID() in x.get_Parent()]:
-                setupseq(m, fasta_dict, r"^{} .*")
-                for e in [x for x in exons if  m.get_ID() in x.get_Parent()]:
-                    setupseq(e, fasta_dict, r"^{} .*")
-                    e.embed_into(m)
-                for f in [x for x in five_prime_utrs if  m.get_ID() in x.get_Parent()]:
-                    setupseq(f, fasta_dict, r"^{} .*")
-                    f.embed_into(m)
-                for t in [x for x in five_prime_utrs if  m.get_ID() in x.get_Parent()]:
-                    setupseq(t, fasta_dict, r"^{} .*")
-                    t.embed_into(m)
-            out.write(json.dumps([x for x in mrnas if g.get_ID() in x.get_Parent()],default=lambda o: o.__dict__, sort_keys=True, indent=2))
+            models = []
+            for m in graph.children(g.get_ID(), type="mRNA"):
+                setupseq(m, fasta_lookup)
+                model = m.to_dict()
+                for t in ["exon", "five_prime_UTR", "three_prime_UTR"]:
+                    parts = graph.children(m.get_ID(), type=t)
+                    for p in parts:
+                        setupseq(p, fasta_lookup)
+                    if parts:
+                        model[t] = parts
+                models.append(model)
+            out.write(json.dumps(models, default=lambda o: o.to_dict() if isinstance(o, gh.GFFObject) else o.__dict__, sort_keys=True, indent=2))
 
 if __name__ == "__main__":
     main()
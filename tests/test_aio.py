@@ -0,0 +1,90 @@
+import pytest
+import asyncio
+import os
+import threading
+import time
+import dustdas.fastahelper as fh
+from dustdas import aio
+from dustdas import gffhelper
+
+dir = os.path.dirname(__file__)
+
+
+def collect(aiterable):
+    async def run():
+        return [batch async for batch in aiterable]
+    return asyncio.run(run())
+
+
+def test_aread_gff_file():
+    gff = os.path.join(dir, "test.gff3")
+    batches = collect(aio.aread_gff_file(gff, batch_size=10))
+    assert [len(b) for b in batches] == [10, 10, 3]
+    assert [repr(o) for b in batches for o in b] == [repr(o) for o in gffhelper.read_gff_file(gff)]
+
+
+def test_aread_fasta():
+    fasta = os.path.join(dir, "test.fa")
+    batches = collect(aio.aread_fasta(fasta, batch_size=1))
+    assert [b for batch in batches for b in batch] == list(fh.FastaParser.read_fasta(fasta))
+
+
+def test_aread_cancel():
+    gff = os.path.join(dir, "test.gff3")
+
+    async def run():
+        seen = []
+
+        async def consume():
+            async for batch in aio.aread_gff_file(gff, batch_size=1):
+                seen.append(batch)
+                await asyncio.sleep(10)
+        task = asyncio.ensure_future(consume())
+        while not seen:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return seen
+    assert len(asyncio.run(run())) == 1
+
+
+def test_abatches_cancel_in_flight():
+    started = threading.Event()
+    closed = threading.Event()
+
+    def slow():
+        try:
+            yield 1
+            started.set()
+            time.sleep(0.3)
+            yield 2
+        finally:
+            closed.set()
+
+    async def run():
+        async def consume():
+            async for batch in aio._abatches(slow(), 1):
+                pass
+        task = asyncio.ensure_future(consume())
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()  # while the thread is inside next()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not closed.is_set()
+        await asyncio.sleep(0.5)
+    asyncio.run(run())
+    assert closed.is_set()
+
+
+def test_aread_break():
+    gff = os.path.join(dir, "test.gff3")
+
+    async def run():
+        reader = aio.aread_gff_file(gff, batch_size=5)
+        async for batch in reader:
+            break
+        await reader.aclose()
+        return batch
+    assert len(asyncio.run(run())) == 5
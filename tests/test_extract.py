@@ -0,0 +1,98 @@
+import pytest
+import os
+import shutil
+import dustdas.fastahelper as fh
+from dustdas import extract
+from dustdas import gffhelper
+
+dir = os.path.dirname(__file__)
+
+# chr1: t1 with exons 3-8 and 12-18 on the plus strand, t2 with exons 21-27 and 31-36 on the minus strand
+GENOME = ">chr1 test\nCCATGAAAGGGTTTCCCTAGCCTTACCCGGGCATCCC\n"
+GFF = """##gff-version 3
+chr1\t.\tgene\t3\t18\t.\t+\t.\tID=g1
+chr1\t.\tmRNA\t3\t18\t.\t+\t.\tID=t1;Parent=g1
+chr1\t.\texon\t3\t8\t.\t+\t.\tID=t1.e1;Parent=t1
+chr1\t.\texon\t12\t18\t.\t+\t.\tID=t1.e2;Parent=t1
+chr1\t.\tCDS\t3\t8\t.\t+\t0\tID=t1.c;Parent=t1
+chr1\t.\tCDS\t12\t17\t.\t+\t0\tID=t1.c;Parent=t1
+chr1\t.\tmRNA\t21\t36\t.\t-\t.\tID=t2
+chr1\t.\texon\t31\t36\t.\t-\t.\tParent=t2
+chr1\t.\texon\t21\t27\t.\t-\t.\tParent=t2
+chr1\t.\tCDS\t31\t35\t.\t-\t1\tParent=t2
+chr1\t.\tCDS\t22\t27\t.\t-\t0\tParent=t2
+chr2\t.\tgene\t1\t9\t.\t+\t.\tID=g2
+chr2\t.\tCDS\t1\t9\t.\t+\t0\tParent=g2
+"""
+
+
+@pytest.fixture
+def files(tmp_path):
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(GENOME + ">chr2\nATGTGGTAA\n")
+    gff = tmp_path / "genes.gff3"
+    gff.write_text(GFF)
+    return str(gff), str(fasta)
+
+
+def test_extract_sequences(files):
+    gff, fasta = files
+    seqs = {t.id: t for t in extract.extract_sequences(gff, fasta)}
+    assert list(seqs) == ["t1", "t2", "g2"]
+    g = GENOME.split("\n")[1]
+    assert seqs["t1"].transcript == g[2:8] + g[11:18]
+    assert seqs["t1"].cds == [("t1", "ATGAAATTTCCC", "MKFP")]
+    t2 = fh.FastaHelper.reverse_complement(g[20:27] + g[30:36])
+    assert seqs["t2"].strand == "-"
+    assert seqs["t2"].transcript == t2
+    # phase 1 on the first CDS part in transcription order (31-35) skips one base
+    cds = fh.FastaHelper.reverse_complement(g[21:27] + g[30:35])[1:]
+    assert seqs["t2"].cds == [("t2", cds, fh.SeqTranslator.dna2prot(cds))]
+    # a CDS directly below its gene
+    assert seqs["g2"].transcript == "ATGTGGTAA"
+    assert seqs["g2"].cds == [("g2", "ATGTGGTAA", "MW*")]
+
+
+def test_extract_matches_get_sequence(tmp_path):
+    fasta = str(tmp_path / "test.fa")
+    shutil.copy(os.path.join(dir, "test.fa"), fasta)
+    genome = {h.split()[0]: s for h, s in fh.FastaParser.read_fasta(fasta)}
+    gff = gffhelper.GFFFile(os.path.join(dir, "test.gff3"))
+    exons = [o for o in gff.get_gff_objects() if o.type == "exon"]
+    seqs = {t.id: t for t in extract.extract_sequences(gff, fasta)}
+    assert set(seqs) == {"mRNA00001", "mRNA00002", "mRNA00003"}
+    for tid, t in seqs.items():
+        parts = sorted((o for o in exons if tid in o.get_Parent()), key=lambda o: int(o.start))
+        assert t.transcript == "".join(fh.FastaParser.get_sequence_by_coordinates(genome["ctg123"], o.start, o.end, o.strand)
+                                       for o in parts)
+    assert [name for name, _, _ in seqs["mRNA00003"].cds] == ["cds00003", "cds00004"]
+
+
+def test_write_sequences(files, tmp_path):
+    gff, fasta = files
+    out = {k: str(tmp_path / (k + ".fa")) for k in ("transcripts", "cds", "proteins")}
+    assert extract.write_sequences(gff, fasta, width=5, **out) == 3
+    proteins = list(fh.FastaParser.read_fasta(out["proteins"]))
+    assert proteins[0] == ("t1", "MKFP")
+    assert proteins[2] == ("g2", "MW*")
+    assert [h for h, _ in fh.FastaParser.read_fasta(out["transcripts"])] == ["t1", "t2", "g2"]
+    with open(out["cds"]) as f:
+        assert f.read().startswith(">t1\nATGAA\nATTTC\nCC\n")
+
+
+def test_extract_missing_seqid(files, tmp_path):
+    gff, _ = files
+    fasta = tmp_path / "chr1.fa"
+    fasta.write_text(GENOME)
+    with pytest.warns(UserWarning):
+        seqs = list(extract.extract_sequences(gff, str(fasta)))
+    assert [t.id for t in seqs] == ["t1", "t2"]
+
+
+@pytest.mark.parametrize("as_dict", [False, True])
+def test_extract_parallel(files, as_dict):
+    gff, fasta = files
+    if as_dict:
+        fasta = {h.split()[0]: s for h, s in fh.FastaParser.read_fasta(fasta)}
+    serial = list(extract.extract_sequences(gff, fasta))
+    assert list(extract.extract_sequences(gff, fasta, parallel=2)) == serial
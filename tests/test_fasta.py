@@ -0,0 +1,351 @@
+import pytest
+import os
+import shutil
+import dustdas.fastahelper as fh
+from dustdas import gffhelper
+
+dir = os.path.dirname(__file__)
+
+
+@pytest.fixture
+def fasta(tmp_path):
+    """copy of test.fa in a temporary directory, so indices are not written into the repository"""
+    p = str(tmp_path / "test.fa")
+    shutil.copy(os.path.join(dir, "test.fa"), p)
+    return p
+
+
+@pytest.fixture
+def fasta_dict():
+    return {h.split()[0]: s for h, s in fh.FastaParser.read_fasta(os.path.join(dir, "test.fa"))}
+
+
+def test_fai_build(fasta):
+    idx = fh.FastaIndex.for_fasta(fasta)
+    assert list(idx) == ["ctg123", "ctg456"]
+    assert tuple(idx["ctg123"]) == ("ctg123", 10000, 20, 60, 61)
+    assert tuple(idx["ctg456"]) == ("ctg456", 250, 10195, 60, 61)
+    assert os.path.exists(fasta + ".fai")
+    assert [tuple(r) for r in fh.FastaIndex.read(fasta + ".fai")._records.values()] == \
+           [tuple(r) for r in idx._records.values()]
+
+
+def test_fai_inconsistent_lines(tmp_path):
+    p = str(tmp_path / "bad.fa")
+    with open(p, "w") as f:
+        f.write(">a\nACGT\nAC\nACGT\n")
+    with pytest.raises(fh.FastaIndexException):
+        fh.FastaIndex.build(p)
+
+
+def test_fasta_lookup(fasta, fasta_dict):
+    whole = fh.FastaParser.read_fasta_whole(fasta)
+    lookup = fh.FastaLookup(whole)
+    assert list(lookup) == ["ctg123", "ctg456"]
+    assert lookup["ctg123"] == ("ctg123 test contig", fasta_dict["ctg123"])
+    assert "ctg123 test contig" not in lookup
+    by_regex = fh.FastaLookup(whole, key=r"ctg(\d+)")
+    assert by_regex["456"][0] == "ctg456"
+    by_function = fh.FastaLookup(whole, key=lambda h: h.upper().split()[0])
+    assert "CTG123" in by_function
+    assert lookup.match(r"^ctg4") == ("ctg456", fasta_dict["ctg456"])
+    assert lookup.match(r"^chr") is None
+
+
+def test_gffobject_get_sequence_lookup(fasta, fasta_dict):
+    o = list(gffhelper.GFFFile(os.path.join(dir, "test.gff3")).get_gff_objects())[0]
+    whole = fh.FastaParser.read_fasta_whole(fasta)
+    expected = ("ctg123 test contig", fasta_dict["ctg123"])
+    assert o.get_sequence(lookup=fh.FastaLookup(whole)) == expected
+    assert o.get_sequence(fastadct=whole, regex=r"^ctg123 .*") == expected
+    assert o.get_sequence(fastafile=fasta, regex=r"^ctg123 .*") == expected
+    assert o.get_sequence(lookup=fh.FastaLookup(fasta), regex=r"^ctg123 .*") == expected
+    # no hidden caches: changes to the dict are seen by the next call
+    whole["ctg123 test contig"] = "ACGT"
+    assert o.get_sequence(fastadct=whole, regex=r"^ctg123 .*") == ("ctg123 test contig", "ACGT")
+
+
+def test_gffobject_get_sequence_fastafile_indexed(tmp_path, monkeypatch):
+    import gzip
+    p = str(tmp_path / "g.fa")
+    with open(p, "w") as f:
+        f.write(">chr0 first\nTT\n>chr1\nACGTA\nCC\n>chr2 more words\nGG\n")
+    with open(p, "rb") as f, gzip.open(p + ".gz", "wb") as out:
+        out.write(f.read())
+    line = "{}\t.\tgene\t1\t2\t.\t+\t.\tID=g"
+    chr1, chr2 = (gffhelper.GFFObject(line.format(s)) for s in ("chr1", "chr2"))
+    assert chr2.get_sequence(fastafile=p) is None  # header isn't exactly chr2
+    assert chr2.get_sequence(fastafile=p, regex="chr2") == ("chr2 more words", "GG")
+    assert chr1.get_sequence(fastafile=p + ".gz") == ("chr1", "ACGTACC")
+    with fh.IndexedFasta(p) as fa:
+        assert [fa.header(s) for s in fa] == ["chr0 first", "chr1", "chr2 more words"]
+    # only the .fai and the record are read
+    monkeypatch.setattr(fh.FastaParser, "read_fasta", None)
+    assert chr1.get_sequence(fastafile=p) == ("chr1", "ACGTACC")
+    assert os.path.exists(p + ".fai")
+
+
+@pytest.mark.parametrize("seqid, start, end", [
+    ("ctg123", 1, 10000),
+    ("ctg123", 1, 60),
+    ("ctg123", 60, 61),
+    ("ctg123", 1999, 4101),
+    ("ctg123", 9990, 12000),
+    ("ctg456", 100, 151),
+    ])
+def test_indexed_fetch(fasta, fasta_dict, seqid, start, end):
+    with fh.IndexedFasta(fasta) as fa:
+        assert fa.fetch(seqid, start, end) == fasta_dict[seqid][start - 1:end]
+        assert fa.fetch_region("{}:{:,}-{}".format(seqid, start, end)) == fasta_dict[seqid][start - 1:end]
+        assert fa[seqid][start - 1:end] == fasta_dict[seqid][start - 1:end]
+        assert len(fa[seqid]) == len(fasta_dict[seqid])
+
+
+def test_indexed_crlf(tmp_path):
+    p = str(tmp_path / "crlf.fa")
+    with open(p, "wb") as f:
+        f.write(b">a desc\r\nACGTA\r\nCCGGT\r\nAA\r\n>b\r\nTTTT\r\n")
+    with fh.IndexedFasta(p) as fa:
+        assert fa.fetch("a") == "ACGTACCGGTAA"
+        assert fa.fetch("a", 4, 7) == "TACC"
+        assert fa.fetch("b", 2, 3) == "TT"
+
+
+@pytest.mark.parametrize("start, end, strand", [
+    (1000, 1012, "+"),
+    (1000, 1012, "-"),
+    (7000, 7600, "-"),
+    ])
+def test_coordinates_indexed(fasta, fasta_dict, start, end, strand):
+    with fh.IndexedFasta(fasta) as fa:
+        expected = fh.FastaParser.get_sequence_by_coordinates(fasta_dict["ctg123"], start, end, strand)
+        assert fh.FastaParser.get_sequence_by_coordinates(fa["ctg123"], start, end, strand) == expected
+
+
+def test_gffobject_get_sequence_indexed(fasta, fasta_dict):
+    o = list(gffhelper.GFFFile(os.path.join(dir, "test.gff3")).get_gff_objects())[0]
+    with fh.IndexedFasta(fasta) as fa:
+        h, s = o.get_sequence(fastadct=fa)
+        assert h == "ctg123"
+        assert s[int(o.start) - 1:int(o.end)] == fasta_dict["ctg123"][int(o.start) - 1:int(o.end)]
+
+
+@pytest.mark.parametrize("seqid, start, end", [
+    ("ctg123", 1, 10000),
+    ("ctg123", 60, 61),
+    ("ctg123", 1999, 4101),
+    ("ctg456", 100, 151),
+    ])
+def test_mmap_fetch(fasta, fasta_dict, seqid, start, end):
+    with fh.MmapFasta(fasta) as fa:
+        assert fa.fetch(seqid, start, end) == fasta_dict[seqid][start - 1:end]
+        assert fa.fetch_bytes(seqid, start, end) == fasta_dict[seqid][start - 1:end].encode()
+        assert fa[seqid][start - 1:end] == fasta_dict[seqid][start - 1:end]
+
+
+def test_mmap_record_view(fasta, fasta_dict):
+    with open(fasta, "rb") as f:
+        raw = f.read()
+    with fh.MmapFasta(fasta) as fa:
+        v = fa.record_view("ctg456")
+        assert isinstance(v, memoryview)
+        assert v.tobytes().replace(b"\n", b"") == fasta_dict["ctg456"].encode()
+        assert v.tobytes() == raw[fa.index["ctg456"].offset:].rstrip(b"\n")
+        v.release()
+    # closing with a view still in use keeps the map until the view goes away
+    fa = fh.MmapFasta(fasta)
+    v = fa.record_view("ctg456")
+    fa.close()
+    assert v.tobytes().replace(b"\n", b"") == fasta_dict["ctg456"].encode()
+    v.release()
+
+
+def test_mmap_pickle(fasta, fasta_dict):
+    import pickle
+    with fh.MmapFasta(fasta) as fa:
+        fb = pickle.loads(pickle.dumps(fa))
+    assert isinstance(fb, fh.MmapFasta)
+    assert fb.fetch("ctg456") == fasta_dict["ctg456"]
+    fb.close()
+
+
+@pytest.fixture
+def bgzf_fasta(tmp_path, monkeypatch):
+    """bgzip compressed copy of test.fa, in small blocks so that regions span several of them"""
+    from dustdas import bgzf
+    monkeypatch.setattr(bgzf, "BGZF_BLOCK_DATA_SIZE", 1000)
+    p = str(tmp_path / "test.fa.gz")
+    with open(os.path.join(dir, "test.fa"), "rb") as f, bgzf.BgzfWriter(p) as out:
+        out.write(f.read())
+    return p
+
+
+def test_bgzf_detection(fasta, bgzf_fasta, tmp_path):
+    import gzip
+    from dustdas import bgzf
+    p = str(tmp_path / "plain.fa.gz")
+    with gzip.open(p, "wb") as out:
+        out.write(b">a\nACGT\n")
+    assert bgzf.is_bgzf(bgzf_fasta)
+    assert not bgzf.is_bgzf(p)
+    assert not bgzf.is_bgzf(fasta)
+    with pytest.raises(fh.FastaIndexException):
+        fh.IndexedFasta(p)
+    # bgzf is still readable from the start as ordinary gzip
+    assert fh.FastaParser.read_fasta_whole(bgzf_fasta) == fh.FastaParser.read_fasta_whole(fasta)
+
+
+def test_bgzf_gzi(bgzf_fasta):
+    from dustdas import bgzf
+    built = bgzf.BgzfIndex.build(bgzf_fasta)
+    # 11 data blocks and the empty end of file block
+    assert len(built.coffsets) == 12
+    assert built.uoffsets == list(range(0, 11000, 1000)) + [10450]
+    with bgzf.BgzfReader(bgzf_fasta) as f, bgzf.BgzfWriter(bgzf_fasta + ".2.gz") as out:
+        out.write(f.read())
+    assert out.index.coffsets == built.coffsets
+    built.write(bgzf_fasta + ".gzi")
+    assert bgzf.BgzfIndex.read(bgzf_fasta + ".gzi").coffsets == built.coffsets
+
+
+@pytest.mark.parametrize("seqid, start, end", [
+    ("ctg123", 1, 10000),
+    ("ctg123", 990, 1010),
+    ("ctg123", 1999, 4101),
+    ("ctg456", 100, 151),
+    ])
+def test_bgzf_indexed_fetch(fasta, bgzf_fasta, fasta_dict, seqid, start, end):
+    with fh.IndexedFasta(bgzf_fasta) as fa:
+        assert tuple(fa.index[seqid]) == tuple(fh.FastaIndex.build(fasta)[seqid])
+        assert fa.fetch(seqid, start, end) == fasta_dict[seqid][start - 1:end]
+    assert os.path.exists(bgzf_fasta + ".fai")
+    assert os.path.exists(bgzf_fasta + ".gzi")
+
+
+def test_bgzf_virtual_offsets(bgzf_fasta):
+    from dustdas import bgzf
+    with bgzf.BgzfReader(bgzf_fasta) as f:
+        f.seek(2500)
+        v = f.tell_virtual()
+        data = f.read(10)
+        f.seek(0)
+        f.seek_virtual(v)
+        assert f.read(10) == data
+        assert f.tell() == 2510
+
+
+@pytest.mark.parametrize("width", [60, 7, 0])
+def test_fasta_writer(tmp_path, fasta_dict, width):
+    p = str(tmp_path / "out.fa")
+    records = [("ctg123 test contig", fasta_dict["ctg123"]), ("empty", ""), ("ctg456", fasta_dict["ctg456"].encode()),
+               ("short", "ACGT")]
+    with fh.FastaWriter(p, width=width, index=True) as out:
+        assert out.write_many(records) == 4
+    with open(p) as f:
+        lines = f.read().split("\n")
+    assert lines[0] == ">ctg123 test contig"
+    assert len(lines[1]) == (width or 10000)
+    assert [(h, s) for h, s in fh.FastaParser.read_fasta(p)] == \
+           [(h, s.decode() if isinstance(s, bytes) else s) for h, s in records]
+    written = fh.FastaIndex.read(p + ".fai")
+    assert tuple(written["short"])[3:] == (4, 5)
+    assert [tuple(written[n]) for n in written] == [tuple(r) for r in (fh.FastaIndex.build(p)[n] for n in written)]
+    with fh.IndexedFasta(p) as fa:
+        assert fa.fetch("ctg456", 3, 40) == fasta_dict["ctg456"][2:40]
+
+
+def test_fasta_writer_compressed(tmp_path, fasta_dict, monkeypatch):
+    from dustdas import bgzf
+    monkeypatch.setattr(bgzf, "BGZF_BLOCK_DATA_SIZE", 1000)
+    p = str(tmp_path / "out.fa.gz")
+    with fh.FastaWriter(p, compression="bgzf", index=True) as out:
+        out.write("ctg123", fasta_dict["ctg123"])
+    assert bgzf.is_bgzf(p)
+    assert os.path.exists(p + ".gzi")
+    with fh.IndexedFasta(p) as fa:
+        assert fa.fetch("ctg123", 1990, 4200) == fasta_dict["ctg123"][1989:4200]
+    g = str(tmp_path / "out2.fa.gz")
+    with fh.FastaWriter(g, compression="gzip") as out:
+        out.write("ctg456", fasta_dict["ctg456"])
+    assert list(fh.FastaParser.read_fasta(g)) == [("ctg456", fasta_dict["ctg456"])]
+    with pytest.raises(fh.FastaIndexException):
+        fh.FastaWriter(str(tmp_path / "x.fa.gz"), compression="gzip", index=True)
+
+
+def test_fasta_writer_text_handle():
+    import io
+    out = io.StringIO()
+    fh.FastaWriter(out, width=4).write("x", "ACGTACGTA")
+    assert out.getvalue() == ">x\nACGT\nACGT\nA\n"
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 5, 64, 1 << 22])
+def test_read_fasta_blocks(fasta, block_size):
+    expected = list(fh.FastaParser.read_fasta(fasta))
+    assert list(fh.FastaParser.read_fasta_blocks(fasta, block_size=block_size)) == expected
+    assert list(fh.FastaParser.read_fasta_blocks(fasta, binary=True, block_size=block_size)) == \
+           [(h.encode(), s.encode()) for h, s in expected]
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 1 << 22])
+def test_read_fasta_blocks_line_ends(tmp_path, block_size):
+    p = tmp_path / "odd.fa"
+    p.write_bytes(b"\n\n>a first\r\nAC\r\n\r\nGT\r\n>b\r\n>c\nAC\n\nG\n\nT")
+    assert list(fh.FastaParser.read_fasta_blocks(str(p), block_size=block_size)) == \
+           [("a first", "ACGT"), ("b", ""), ("c", "ACGT")]
+
+
+def test_read_fasta_blocks_gzip(tmp_path, fasta):
+    import gzip
+    p = str(tmp_path / "test.fa.gz")
+    with open(fasta, "rb") as f, gzip.open(p, "wb") as out:
+        out.write(f.read())
+    assert list(fh.FastaParser.read_fasta_blocks(p)) == list(fh.FastaParser.read_fasta(fasta))
+
+
+def test_packed_genome(tmp_path, fasta, fasta_dict):
+    genome = fh.PackedGenome.from_fasta(fasta)
+    p = str(tmp_path / "test.2bit")
+    genome.write(p)
+    rc = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+    with fh.PackedGenome.open(p) as mapped:
+        for g in (genome, mapped):
+            assert list(g) == ["ctg123", "ctg456"]
+            for seqid, seq in fasta_dict.items():
+                assert str(g[seqid]) == seq
+                for start, end in [(1, len(seq)), (3, 3), (5, 12), (1999, 4101), (len(seq) - 6, len(seq))]:
+                    assert g.fetch(seqid, start, end) == seq[start - 1:end]
+                    assert g.fetch(seqid, start, end, "-") == seq[start - 1:end].translate(rc)[::-1]
+            assert fh.FastaParser.get_sequence_by_coordinates(g["ctg123"], 10, 90, "+") == fasta_dict["ctg123"][9:90]
+
+
+def test_packed_genome_twobit_layout(tmp_path):
+    p = str(tmp_path / "x.2bit")
+    fh.PackedGenome.from_sequences([("x", "ACgTNR")]).write(p)
+    with open(p, "rb") as f:
+        raw = f.read()
+    assert raw == (b"\x43\x27\x41\x1a" + b"\x00" * 4 + b"\x01\x00\x00\x00" + b"\x00" * 4 +  # header
+                   b"\x01x" + b"\x16\x00\x00\x00" +  # index
+                   b"\x06\x00\x00\x00" + b"\x01\x00\x00\x00" + b"\x04\x00\x00\x00" + b"\x02\x00\x00\x00" +  # N run
+                   b"\x01\x00\x00\x00" + b"\x02\x00\x00\x00" + b"\x01\x00\x00\x00" +  # mask run
+                   b"\x00" * 4 + b"\x9c\x00")  # ACGT TT(pad)
+    with fh.PackedGenome.open(p) as g:
+        assert g.fetch("x") == "ACgTNN"
+        assert g.fetch("x", 2, 4, "-") == "AcG"
+        with pytest.raises(fh.StrandOrientationException):
+            g.fetch("x", strand="?")
+
+
+def test_complement_iupac():
+    assert fh.FastaHelper.complement("ACGTUNRYSWKMBDHV-acgtunryswkmbdhv*") == "TGCAANYRSWMKVHDB-tgcaanyrswmkvhdb*"
+    assert fh.FastaHelper.reverse_complement("AACRn") == "nYGTT"
+    assert fh.FastaHelper.reverse_complement(b"AACRn") == b"nYGTT"
+    assert fh.FastaHelper.reverse_complement(bytearray(b"AACRn")) == bytearray(b"nYGTT")
+    seqs = ["ACGGN", "", "tgcay"]
+    assert fh.FastaHelper.reverse_complement_many(seqs) == [fh.FastaHelper.reverse_complement(s) for s in seqs]
+    assert fh.FastaHelper.reverse_complement_many([s.encode() for s in seqs]) == \
+           [fh.FastaHelper.reverse_complement(s).encode() for s in seqs]
+    assert fh.FastaHelper.reverse_complement_many([]) == []
+    assert fh.FastaParser.get_sequence_by_coordinates("AAGGCRT", 2, 6, "-") == "YGCCT"
+    with pytest.raises(fh.StrandOrientationException):
+        fh.FastaParser.get_sequence_by_coordinates("AAGGCRT", 2, 6, "x")
@@ -1,8 +1,17 @@
 import pytest
 from dustdas import gffhelper
+import gzip
+import json
+import math
 import os
 import sys
+import zipfile
 import dustdas.fastahelper as fh
+from dustdas import bgzf, gfftokenizer, tabix
+from dustdas.census import GFFCensus
+from dustdas.featuregraph import FeatureGraph
+from dustdas.gfftable import GFFTable
+from dustdas.intervalindex import GFFIntervalIndex
 
 dir = os.path.dirname(__file__)
 
@@ -239,7 +248,6 @@ def test_mrna_cds(gff, expected):
      os.path.join(dir,'Ath/Athaliana/annotation/Athaliana_167_TAIR10.cds.fa'),"tmp", "ABC", "DEF"),
 ])
 def test_proteinconversion(gff, fasta, id, expected_dna_sequence, expected_pep_sequence):
-    import dustdas.fastahelper as fh
     gf = gffhelper.GFFFile(gff)
     objs =  list(gf.get_gff_objects())
     fasta_dict = fh.FastaParser.read_fasta_whole(fasta)
@@ -260,7 +268,6 @@ def test_proteinconversion(gff, fasta, id, expected_dna_sequence, expected_pep_s
      os.path.join(dir,'genomes/Ath.short.fa'),"tmp", "ABC", "DEF"),
 ])
 def test_proteinconversion(gff, fasta, id, expected_dna_sequence, expected_pep_sequence):
-    import dustdas.fastahelper as fh
     gf = gffhelper.GFFFile(gff)
     objs =  list(gf.get_gff_objects())
     fasta_dict = fh.FastaParser.read_fasta_whole(fasta)
@@ -311,4 +318,354 @@ def setupseq(gffobj, fastadct, regex):
 
 
         #todo verbalexpressions
-    '''
\ No newline at end of file
+    '''
+
+@pytest.fixture
+def sorted_bgzf_gff(tmp_path, monkeypatch):
+    """test.gff3 sorted by start and bgzip compressed in small blocks"""
+    monkeypatch.setattr(bgzf, "BGZF_BLOCK_DATA_SIZE", 200)
+    with open(os.path.join(dir, 'test.gff3')) as f:
+        lines = f.readlines()
+    header = [l for l in lines if l.startswith("#")]
+    features = sorted([l for l in lines if not l.startswith("#")], key=lambda l: int(l.split("\t")[3]))
+    p = str(tmp_path / "test.sorted.gff3.gz")
+    with bgzf.BgzfWriter(p) as out:
+        out.write("".join(header + features).encode())
+    return p
+
+
+@pytest.mark.parametrize("start, end", [
+    (1, 999),
+    (1000, 1000),
+    (1013, 1049),
+    (1501, 2999),
+    (3500, 3600),
+    (7601, 20000),
+    (1, 20000),
+    ])
+def test_fetch_bgzf_region(sorted_bgzf_gff, start, end):
+    g = gffhelper.GFFFile(sorted_bgzf_gff)
+    expected = [repr(o) for o in g.get_gff_objects() if int(o.start) <= end and int(o.end) >= start]
+    assert [repr(o) for o in g.fetch("ctg123", start, end)] == expected
+    assert os.path.exists(sorted_bgzf_gff + ".tbi")
+    assert list(g.fetch("ctg1234", start, end)) == []
+
+
+def test_tabix_index_roundtrip(sorted_bgzf_gff):
+    built = tabix.TabixIndex.build(sorted_bgzf_gff)
+    built.write(sorted_bgzf_gff + ".tbi")
+    read = tabix.TabixIndex.read(sorted_bgzf_gff + ".tbi")
+    assert read.names == ["ctg123"]
+    assert read.references[0].bins == built.references[0].bins
+    assert read.references[0].linear == built.references[0].linear
+    assert read.chunks("ctg123", 3000, 3100) == built.chunks("ctg123", 3000, 3100)
+
+
+def test_tabix_unsorted(tmp_path):
+    p = str(tmp_path / "test.gff3.gz")
+    with open(os.path.join(dir, 'test.gff3'), "rb") as f, bgzf.BgzfWriter(p) as out:
+        out.write(f.read())
+    with pytest.raises(tabix.TabixException):
+        tabix.TabixIndex.build(p)
+    # fetch falls back to scanning the file
+    g = gffhelper.GFFFile(p)
+    expected = [repr(o) for o in g.get_gff_objects() if int(o.start) <= 3400 and int(o.end) >= 3300]
+    assert expected
+    assert [repr(o) for o in g.fetch("ctg123", 3300, 3400)] == expected
+
+
+
+def test_tabix_index_looked_up_once(sorted_bgzf_gff, tmp_path, monkeypatch):
+    unsorted = str(tmp_path / "unsorted.gff3.gz")
+    with open(os.path.join(dir, 'test.gff3'), "rb") as f, bgzf.BgzfWriter(unsorted) as out:
+        out.write(f.read())
+    builds = []
+    build = tabix.TabixIndex.build.__func__
+    monkeypatch.setattr(tabix.TabixIndex, "build", classmethod(lambda cls, p: builds.append(p) or build(cls, p)))
+    for p in (sorted_bgzf_gff, unsorted):
+        g = gffhelper.GFFFile(p)
+        for _ in range(3):
+            list(g.fetch("ctg123", 3300, 3400))
+            list(g.query().seqid("ctg123").region(3300, 3400))
+    assert builds == [sorted_bgzf_gff, unsorted]
+
+
+@pytest.mark.parametrize("gff", [
+    os.path.join(dir, 'test.gff3'),
+    os.path.join(dir, 'test3.gff3'),
+    os.path.join(dir, 'test_avail.gff3'),
+    ])
+def test_table_matches_objects(gff):
+    g = gffhelper.GFFFile(gff)
+    objs = list(g.get_gff_objects())
+    t = GFFTable.from_gff_file(g)
+    assert len(t) == len(objs)
+    assert t.count_types() == g.get_available_types()
+    for o, r in zip(objs, t):
+        assert not hasattr(r, "__dict__")
+        assert (r.seqid, r.source, r.type, r.start, r.end, r.strand) == \
+               (o.seqid, o.source, o.type, int(o.start), int(o.end), o.strand)
+        assert r.phase == (None if o.phase == "." else int(o.phase))
+        assert r.score == o.score or (o.score == "." and r.score != r.score)
+        assert r.get_Parent() == o.get_Parent()
+        assert r.get_ID() == o.get_ID()
+
+
+def test_table_rows():
+    t = GFFTable.from_gff_file(os.path.join(dir, 'test.gff3'))
+    assert t.count_seqids() == {"ctg123": 23}
+    assert t.rows(type="mRNA") == [2, 3, 4]
+    assert t.rows(type="CDS", start=7601, end=8000) == []
+    assert [t[i].get_ID() for i in t.rows(type="exon", start=1400, end=3000)] == \
+           ["exon00001", "exon00002", "exon00003"]
+    assert t.rows(seqid="ctg1234") == []
+    sub = t.take(t.rows(type="CDS", strand="+"))
+    assert sub.count_types() == {"CDS": 13}
+
+
+def _table_rows(t):
+    return [tuple(repr(v) for v in t._values(i)) for i in range(len(t))]
+
+
+@pytest.mark.parametrize("newline, trailing", [("\n", "\n"), ("\r\n", ""), ("\n", "")])
+def test_table_parallel(tmp_path, newline, trailing):
+    lines = ["##gff-version 3"]
+    for i in range(3000):
+        if i % 500 == 0:
+            lines += ["# comment {}".format(i), ""]
+        lines.append("\t".join(["chr{}".format(i % 7), "src", ("exon", "CDS", "match_part")[i % 3], str(i + 1),
+                                str(i + 50), "." if i % 2 else "0.5", "+-"[i % 2], ".", "ID=f{};Name=x".format(i)]))
+    p = tmp_path / "big.gff3"
+    p.write_bytes((newline.join(lines) + trailing).encode())
+    serial = GFFTable.from_gff_file(str(p))
+    assert len(serial) == 3000
+    parallel = GFFTable.from_gff_file(str(p), parallel=3)
+    assert _table_rows(parallel) == _table_rows(serial)
+    assert parallel.count_types() == serial.count_types()
+    unordered = GFFTable.from_gff_file(str(p), parallel=3, ordered=False)
+    assert sorted(_table_rows(unordered)) == sorted(_table_rows(serial))
+
+
+def test_table_parallel_bgzf(sorted_bgzf_gff):
+    assert len(fh.line_ranges(sorted_bgzf_gff, 4)) > 1
+    serial = GFFTable.from_gff_file(sorted_bgzf_gff)
+    assert len(serial) == 23
+    assert _table_rows(GFFTable.from_gff_file(sorted_bgzf_gff, parallel=2)) == _table_rows(serial)
+
+
+def test_lazy_attributes():
+    g = gffhelper.GFFFile(os.path.join(dir, 'test.gff3'))
+    o = list(g.get_gff_objects())[6]
+    assert "attributes" not in o.__dict__
+    assert o.get_ID() == "exon00002"
+    assert o.get_Parent() == ["mRNA00001", "mRNA00002"]
+    assert o.get_Name() is None
+    assert "attributes" not in o.__dict__
+    assert [a.tag for a in o.attributes] == ["ID", "Parent"]
+    assert "attributes" in o.__dict__
+    assert o.get_Parent() == ["mRNA00001", "mRNA00002"]
+    assert '"attributes"' in o.to_json()
+
+
+def test_to_json_typed_score():
+    o = gffhelper.GFFObject("ctg123\t.\tgene\t1000\t9000\t.\t+\t.\tID=gene00001", typed=True)
+    assert math.isnan(o.score)
+    assert json.loads(o.to_json(), parse_constant=lambda c: pytest.fail(c))["score"] == "."
+    assert o.parse_score(o.to_dict()) == "."
+    assert o.parse_score({"score": "0.5"}) == 0.5
+    with pytest.raises(ValueError):
+        o.parse_score({"score": "high"})
+    assert math.isnan(o.score)
+
+
+@pytest.mark.parametrize("attribute, expected", [
+    ("ID=a;Name=b", [("ID", ["a"]), ("Name", ["b"])]),
+    ("ID=a; Parent=p1,p2;", [("ID", ["a"]), ("Parent", ["p1", "p2"])]),
+    ("ID=a;Note=x=y", [("ID", ["a"]), ("Note", ["x=y"])]),
+    ("ID=a;Note=one%3B two%2Cthree,four%3D4", [("ID", ["a"]), ("Note", ["one; two,three", "four=4"])]),
+    ])
+def test_tokenizer_attributes(attribute, expected):
+    assert gfftokenizer.parse_attributes(attribute) == expected
+    for tag, values in expected:
+        assert gfftokenizer.find_attribute(attribute, tag) == values
+    assert gfftokenizer.find_attribute(attribute, "Alias") is None
+    o = gffhelper.GFFObject("ctg\t.\tgene\t1\t10\t.\t+\t.\t" + attribute)
+    assert o.get_ID() == "a"
+    assert [(a.tag, a.value) for a in o.attributes if a.tag != "wat"] == expected
+
+
+def test_tokenizer_short_line():
+    with pytest.raises(gfftokenizer.GFFLineException):
+        gffhelper.GFFObject("ctg\t.\tgene\t1\t10")
+
+
+@pytest.mark.parametrize("gff, index, expected", [
+    (os.path.join(dir, 'test.gff3'), 0, (1000, 9000, None)),
+    (os.path.join(dir, 'test.gff3'), 22, (7000, 7600, 1)),
+    (os.path.join(dir, 'test3.gff3'), 1, (1300, 1500, None)),
+    ])
+def test_typed(gff, index, expected):
+    o = list(gffhelper.GFFFile(gff, typed=True).get_gff_objects())[index]
+    assert (o.start, o.end, o.phase) == expected
+    assert isinstance(o.score, float)
+    s = list(gffhelper.GFFFile(gff).get_gff_objects())[index]
+    assert o.score == s.score or (s.score == "." and math.isnan(o.score))
+    r = list(gffhelper.read_gff_file(gff, typed=True))[index]
+    assert (r.start, r.end, r.phase) == expected
+
+
+@pytest.mark.parametrize("seqid, start, end", [
+    ("ctg123", 1, 999),
+    ("ctg123", 1000, 1000),
+    ("ctg123", 1013, 1049),
+    ("ctg123", 1501, 2999),
+    ("ctg123", 3500, 3600),
+    ("ctg123", 7601, 20000),
+    ("ctg1234", 1, 20000),
+    ])
+def test_interval_index(seqid, start, end):
+    g = gffhelper.GFFFile(os.path.join(dir, 'test.gff3'))
+    objs = list(g.get_gff_objects())
+    idx = GFFIntervalIndex(objs)
+    assert len(idx) == len(objs)
+    overlapping = [o for o in objs if o.seqid == seqid and int(o.start) <= end and int(o.end) >= start]
+    key = lambda o: (int(o.start), int(o.end))
+    assert sorted(idx.overlapping(seqid, start, end), key=key) == sorted(overlapping, key=key)
+    contained = [o for o in overlapping if int(o.start) >= start and int(o.end) <= end]
+    assert sorted(idx.contained_in(seqid, start, end), key=key) == sorted(contained, key=key)
+
+
+def test_interval_index_nearest():
+    idx = GFFIntervalIndex.from_gff_file(gffhelper.GFFFile(os.path.join(dir, 'test.gff3')), types=["exon"])
+    assert [o.get_ID() for o in idx.nearest("ctg123", 1400)] == ["exon00002", "exon00001"]
+    assert [o.get_ID() for o in idx.nearest("ctg123", 2000, 2100)] == ["exon00002", "exon00001"]
+    assert [o.get_ID() for o in idx.nearest("ctg123", 2800)] == ["exon00003"]
+    assert [o.get_ID() for o in idx.nearest("ctg123", 10000)] == ["exon00005"]
+    assert idx.nearest("chrX", 10) == []
+    assert [o.get_ID() for o in idx.overlapping("ctg123", 5000)] == ["exon00004"]
+
+
+def test_feature_graph():
+    fg = FeatureGraph.from_gff_file(gffhelper.GFFFile(os.path.join(dir, 'test.gff3')))
+    assert [m.get_ID() for m in fg.children("gene00001", type="mRNA")] == ['mRNA00001', 'mRNA00002', 'mRNA00003']
+    assert [e.get_ID() for e in fg.children("mRNA00002", type="exon")] == ['exon00002', 'exon00004', 'exon00005']
+    assert [c.get_ID() for c in fg.children("mRNA00003", type="CDS")] == ['cds00003'] * 3 + ['cds00004'] * 3
+    assert len(fg.features("cds00001")) == 4
+    assert [p.get_ID() for p in fg.parent("exon00004")] == ['mRNA00001', 'mRNA00002', 'mRNA00003']
+    assert fg.parent("gene00001") == []
+    assert [r.get_ID() for r in fg.roots()] == ["gene00001"]
+    d = fg.descendants("gene00001")
+    assert len(d) == len(set(map(id, d))) == 22
+    assert [e.get_ID() for e in fg.descendants("gene00001", type="exon")] == \
+           ['exon00002', 'exon00003', 'exon00004', 'exon00005', 'exon00001']
+    assert fg.ids(type="mRNA") == ['mRNA00001', 'mRNA00002', 'mRNA00003']
+
+
+def test_embed_into_deprecated():
+    objs = list(gffhelper.GFFFile(os.path.join(dir, 'test.gff3')).get_gff_objects())
+    with pytest.warns(DeprecationWarning):
+        objs[6].embed_into(objs[2])
+    assert objs[2].exon == [objs[6]]
+
+
+def test_metadata_header_only(tmp_path):
+    p = str(tmp_path / "late.gff3")
+    with open(os.path.join(dir, 'test.gff3')) as f:
+        lines = f.readlines()
+    with open(p, "w") as out:
+        out.write("".join(lines + ["##sequence-region ctg999 1 100\n"]))
+    assert gffhelper.GFFFile(p).metadata == ['gff-version 3.2.1', 'sequence-region ctg123 1 1497228']
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zip", None])
+def test_cached_gff(tmp_path, compression):
+    with open(os.path.join(dir, 'test.gff3'), "rb") as f:
+        data = f.read()
+    p = str(tmp_path / "test.gff3")
+    if compression == "gzip":
+        with gzip.open(p, "wb") as out:
+            out.write(data)
+    elif compression == "zip":
+        with zipfile.ZipFile(p, "w") as out:
+            out.writestr("test.gff3", data)
+    else:
+        with open(p, "wb") as out:
+            out.write(data)
+    g = gffhelper.GFFFile(p, cache=True)
+    assert g.get_available_types() == {'exon': 5, 'CDS': 13, 'gene': 1, 'mRNA': 3, 'TF_binding_site': 1}
+    first = [repr(o) for o in g.get_gff_objects()]
+    os.remove(p)
+    assert [repr(o) for o in g.get_gff_objects()] == first
+    assert len(first) == 23
+
+
+def test_query():
+    g = gffhelper.GFFFile(os.path.join(dir, 'test.gff3'))
+    objs = list(g.get_gff_objects())
+    q = g.query()
+    assert q.count() == len(objs)
+    cds = q.type("CDS")
+    assert [repr(o) for o in cds] == [repr(o) for o in objs if o.type == "CDS"]
+    assert cds.seqid("ctg123").count() == 13
+    assert cds.seqid("ctg1234").count() == 0
+    region = q.seqid("ctg123").region(1501, 3000.0)
+    assert [o.get_ID() for o in region] == [o.get_ID() for o in objs if int(o.start) <= 3000 and int(o.end) >= 1501]
+    assert [o.get_ID() for o in q.attr("Parent", "mRNA00003").type("exon")] == \
+           ["exon00001", "exon00003", "exon00004", "exon00005"]
+    assert q.attr("Name", startswith="edenprotein.3").count() == 3
+    assert q.attr("Name").count() == 17
+    assert q.type("exon", "mRNA").where(lambda o: int(o.start) > 5000).count() == 1
+    assert cds.count() == 13  # queries are not changed by deriving new ones
+
+
+def test_query_bgzf(sorted_bgzf_gff):
+    g = gffhelper.GFFFile(sorted_bgzf_gff)
+    expected = [repr(o) for o in g.get_gff_objects() if o.type == "CDS" and int(o.start) <= 3400 and int(o.end) >= 3300]
+    assert [repr(o) for o in g.query().seqid("ctg123").type("CDS").region(3300, 3400)] == expected
+    assert os.path.exists(sorted_bgzf_gff + ".tbi")
+
+
+def test_query_unsorted_bgzf_and_padded_seqid(tmp_path):
+    p = str(tmp_path / "test.gff3.gz")
+    with open(os.path.join(dir, 'test.gff3'), "rb") as f, bgzf.BgzfWriter(p) as out:
+        out.write(f.read() + b"ctg123 \t.\tCDS\t3350\t3360\t.\t+\t0\tID=padded\n")
+    g = gffhelper.GFFFile(p)
+    expected = [o.get_ID() for o in g.get_gff_objects() if o.type == "CDS" and int(o.start) <= 3400 and int(o.end) >= 3300]
+    assert "padded" in expected
+    assert [o.get_ID() for o in g.query().seqid("ctg123").type("CDS").region(3300, 3400)] == expected
+
+
+@pytest.mark.parametrize("gff", [
+    os.path.join(dir, 'test.gff3'),
+    os.path.join(dir, 'test2.gff3'),
+    os.path.join(dir, 'test_avail.gff3'),
+    ])
+def test_census(gff):
+    g = gffhelper.GFFFile(gff)
+    objs = list(g.get_gff_objects())
+    census = g.census()
+    for column, counts in (("type", census.types), ("seqid", census.seqids), ("source", census.sources)):
+        expected = {}
+        for o in objs:
+            expected[getattr(o, column)] = expected.get(getattr(o, column), 0) + 1
+        assert list(counts.items()) == list(expected.items())
+
+
+def test_census_parallel_sidecar(tmp_path, sorted_bgzf_gff):
+    lines = ["chr{}\tsrc{}\t{}\t1\t2\t.\t+\t.\tID=x{}".format(i % 3, i % 2, ("exon", "CDS")[i % 4 == 0], i)
+             for i in range(5000)]
+    p = tmp_path / "many.gff3"
+    p.write_text("##gff-version 3\n" + "\n".join(lines))
+    g = gffhelper.GFFFile(str(p))
+    serial = g.census()
+    assert serial.types == {"CDS": 1250, "exon": 3750}
+    parallel = g.census(parallel=2)
+    assert (parallel.types, parallel.seqids, parallel.sources) == (serial.types, serial.seqids, serial.sources)
+    assert g.get_available_types(sidecar=True) == serial.types
+    sidecar = GFFCensus.sidecar_path(str(p))
+    assert GFFCensus.read(sidecar).seqids == serial.seqids
+    with open(str(p), "a") as f:
+        f.write("\nchr9\tsrc\tgene\t1\t2\t.\t+\t.\tID=y")
+    assert g.get_available_types(sidecar=True)["gene"] == 1
+    b = gffhelper.GFFFile(sorted_bgzf_gff)
+    assert b.census(parallel=2).types == gffhelper.GFFFile(os.path.join(dir, 'test.gff3')).get_available_types()
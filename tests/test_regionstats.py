@@ -0,0 +1,61 @@
+import pytest
+import math
+import os
+import shutil
+import dustdas.fastahelper as fh
+from dustdas import regionstats
+
+dir = os.path.dirname(__file__)
+
+
+def naive(seq):
+    return (sum(c in "GCSgcs" for c in seq), sum(c in "Nn" for c in seq), sum(c.islower() for c in seq))
+
+
+@pytest.mark.parametrize("step", [1, 7, 1024, 1 << 20])
+def test_sequence_counts(step):
+    seq = "ACGTNNacgtnSsGGccx" * 13
+    counts = regionstats.SequenceCounts(seq, step=step)
+    for start in range(0, len(seq), 5):
+        for end in range(start, len(seq) + 3, 11):
+            assert counts.counts(start, end) == naive(seq[start:end])
+
+
+@pytest.fixture
+def fasta_dict():
+    return {h.split()[0]: s for h, s in fh.FastaParser.read_fasta(os.path.join(dir, "test.fa"))}
+
+
+@pytest.mark.parametrize("step", [3, 1024])
+def test_region_stats(tmp_path, fasta_dict, step):
+    gff = os.path.join(dir, "test.gff3")
+    fasta = str(tmp_path / "test.fa")
+    shutil.copy(os.path.join(dir, "test.fa"), fasta)
+    for genome in (fasta, fasta_dict, fh.PackedGenome.from_sequences(fasta_dict), fh.MmapFasta(fasta)):
+        stats = regionstats.region_stats(gff, genome, types=["exon", "CDS"], step=step)
+        assert len(stats) == 18
+        assert [s.type for s in stats[:2]] == ["exon", "exon"]
+        for s in stats:
+            assert (s.gc, s.n, s.masked) == naive(fasta_dict[s.seqid][s.start - 1:s.end])
+    s = stats[0]
+    assert s.id == "exon00001"
+    assert s.length == 201
+    assert s.gc_content == pytest.approx(s.gc / float(201 - s.n))
+    assert s.masked_fraction == pytest.approx(s.masked / 201.0)
+
+
+def test_region_stats_missing_seqid(tmp_path):
+    fasta = tmp_path / "g.fa"
+    fasta.write_text(">chr1\nGGCCaaNN\n")
+    gff = tmp_path / "g.gff3"
+    gff.write_text("##gff-version 3\nchr1\t.\tgene\t1\t8\t.\t+\t.\tID=g1\nchr2\t.\tgene\t1\t8\t.\t+\t.\tID=g2\n"
+                   "chr1\t.\tgene\t5\t20\t.\t+\t.\tID=g3\n")
+    with pytest.warns(UserWarning) as warned:
+        stats = regionstats.region_stats(str(gff), str(fasta))
+    assert len(warned) == 2  # g2 on a missing seqid, g3 past the end of chr1
+    assert len(stats) == 2
+    assert (stats[1].end, stats[1].length, stats[1].masked_fraction, stats[1].n_fraction) == (8, 4, 0.5, 0.5)
+    assert stats[0].gc_content == pytest.approx(4 / 6.0)
+    assert stats[0].n_fraction == 0.25
+    assert stats[0].masked_fraction == 0.25
+    assert math.isnan(regionstats.RegionStats("x", 5, 4, "+", "gene", None, 0, 0, 0).gc_content)
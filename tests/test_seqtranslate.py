@@ -1,6 +1,130 @@
-def test_dna2prot():
-    pass
+import pytest
+import os
+import dustdas.fastahelper as fh
+from dustdas import geneticcode as gc
 
-def test_dna2prot_offset():
-    pass
+dir = os.path.dirname(__file__)
 
+
+@pytest.mark.parametrize("seq, expected", [
+    ("ATGGCCTAA", "MA*"),
+    ("atggcctaa", "MA*"),
+    ("ATGGCCTA", "MA"),
+    ("ATGNNNTAA", "MX*"),
+    ("ATGRCCTAA", "MX*"),
+    ("", ""),
+    (b"ATGGCCTAA", "MA*"),
+    ])
+def test_dna2prot(seq, expected):
+    assert fh.SeqTranslator.dna2prot(seq) == expected
+
+
+@pytest.mark.parametrize("seq, frameshift, expected", [
+    ("AATGGCCTAA", 1, "MA*"),
+    ("AATGGCCTAA", "1", "MA*"),
+    ("CCATGGCCTAA", 2, "MA*"),
+    ("CCATGGCCTAAG", 2, "MA*"),
+    ])
+def test_dna2prot_offset(seq, frameshift, expected):
+    assert fh.SeqTranslator.dna2prot(seq, frameshift=frameshift) == expected
+
+
+def test_dna2prot_all_codons():
+    for codon, aa in fh.SeqTranslator.DNAmap.items():
+        assert fh.SeqTranslator.dna2prot(codon) == aa
+
+
+def test_translate_many():
+    seqs = ["ATGGCCTAA", "AATGTTT", "", "ATGAAAGGGTTTCCC"]
+    assert fh.SeqTranslator.translate_many(seqs) == [fh.SeqTranslator.dna2prot(s) for s in seqs]
+    assert fh.SeqTranslator.translate_many(seqs, frameshift=[0, 1, 0, 3]) == ["MA*", "MF", "", "KGFP"]
+
+
+def test_triplets_frameshift():
+    assert list(fh.SeqTranslator.triplets("AATGGCCT", 1)) == ["ATG", "GCC"]
+    assert list(fh.SeqTranslator.triplets("AATGGCC", 1)) == ["ATG", "GCC"]
+
+
+def test_translate_six_frames():
+    frames = fh.SeqTranslator.translate_six_frames("ATGGCCTAAC")
+    assert frames[:3] == ["MA*", "WPN", "GL"]
+    rc = fh.FastaHelper.reverse_complement("ATGGCCTAAC")
+    assert frames[3:] == [fh.SeqTranslator.dna2prot(rc, f) for f in range(3)]
+
+
+def test_find_orfs():
+    # ATG AAA TTT TAG on the plus strand, ATG AAT AAA TGA on the minus strand
+    seq = "CCATGAAATTTTAGGG" + "TCATTTATTCAT" + "GG"
+    orfs = list(fh.SeqTranslator.find_orfs(seq, min_len=9))
+    assert fh.ORF(3, 14, "+", 2, "MKF") in orfs
+    minus = [o for o in orfs if o.strand == "-"]
+    assert minus == [fh.ORF(17, 28, "-", 2, "MNK")]
+    assert seq[16:28] == fh.FastaHelper.reverse_complement("ATGAATAAATGA")
+
+
+def test_find_orfs_chunks():
+    fasta = os.path.join(dir, "test.fa")
+    idx = fh.IndexedFasta(fasta, index=fh.FastaIndex.build(fasta))
+    seq = idx["ctg123"]
+    whole = sorted(fh.SeqTranslator.find_orfs(str(seq), min_len=60))
+    assert whole
+    assert sorted(fh.SeqTranslator.find_orfs(seq, min_len=60, chunk_size=999)) == whole
+    assert seq.get_bytes(5, 20) == str(seq)[5:20].encode()
+    packed = fh.PackedGenome.from_sequences({"ctg123": str(seq)})["ctg123"]
+    assert sorted(fh.SeqTranslator.find_orfs(packed, min_len=60, chunk_size=999)) == whole
+    for o in whole:
+        dna = str(seq)[o.start - 1:o.end]
+        if o.strand == "-":
+            dna = fh.FastaHelper.reverse_complement(dna)
+        assert fh.SeqTranslator.dna2prot(dna) == o.protein + "*"
+    idx.close()
+
+
+def test_find_orfs_table():
+    # TGA codes for tryptophan in vertebrate mitochondria
+    table = dict(fh.SeqTranslator.DNAmap, TGA="W")
+    seq = "ATGTGAAAATAG"
+    assert [o.protein for o in fh.SeqTranslator.find_orfs(seq, min_len=3)] == ["M"]
+    assert [o.protein for o in fh.SeqTranslator.find_orfs(seq, min_len=3, table=table)] == ["MWK"]
+
+
+@pytest.mark.parametrize("seq, table, expected", [
+    ("ATGTGAAGA", 1, "M*R"),
+    ("ATGTGAAGA", 2, "MW*"),
+    ("ATGTGAAGA", "2", "MW*"),
+    ("ATGTGAAGA", "Vertebrate Mitochondrial", "MW*"),
+    ("CTGTAA", 3, "T*"),
+    ("TAATAG", 6, "QQ"),
+    ])
+def test_dna2prot_table(seq, table, expected):
+    assert fh.SeqTranslator.dna2prot(seq, table=table) == expected
+
+
+@pytest.mark.parametrize("seq, expected", [
+    ("GCNTARYTGNNNAGR", "A*LXR"),
+    ("gcnMGA", "AR"),
+    ("AT-", "X"),
+    ])
+def test_dna2prot_iupac(seq, expected):
+    assert fh.SeqTranslator.dna2prot(seq) == expected
+
+
+def test_rna2prot():
+    assert fh.SeqTranslator.rna2prot("AUGGCCUAA") == "MA*"
+    assert fh.SeqTranslator.rna2prot("AUGUGA", table=2) == "MW"
+    assert fh.SeqTranslator.RNAmap["UGG"] == "W"
+
+
+def test_genetic_codes():
+    assert gc.get_code(1).codons == fh.SeqTranslator.DNAmap
+    assert gc.get_code(11).start_codons == ("TTG", "CTG", "ATT", "ATC", "ATA", "ATG", "GTG")
+    assert gc.get_code(2).stop_codons == ("TAA", "TAG", "AGA", "AGG")
+    with pytest.raises(gc.GeneticCodeException):
+        gc.get_code(7)
+
+
+def test_find_orfs_alternative_starts():
+    seq = "GTGAAATAG"
+    assert list(fh.SeqTranslator.find_orfs(seq, min_len=3)) == []
+    orfs = list(fh.SeqTranslator.find_orfs(seq, min_len=3, start_codons=None, table=11))
+    assert orfs == [fh.ORF(1, 9, "+", 0, "MK")]